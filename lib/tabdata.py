@@ -9,7 +9,7 @@
 # we use dymamic method assignment to attach methods defined in other files
 # (instead of mix-in, which could be a better choice if this code grows too much)
 #
-#  NOTE: This should really be redoe using numpy
+# Data is kept in numpy arrays (see class docstring for layout).
 #
 # This program is free software: you can redistribute it and/or modify
 # it under the terms of the GNU General Public License as published by
@@ -25,9 +25,13 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-import sys, csv, copy
+import os, copy, functools, multiprocessing
+from collections import OrderedDict
+import numpy as np
 
 from .tabdata_common import *
+from .tabdata_time import *
+from .tabdata_stats import *
 
 
 class TabData:
@@ -40,6 +44,13 @@ class TabData:
         so normally time[i], data[j][i] would be (x,y) for a specific point
         i - data index; i in [0..N-1]
         j - value (column) selection index; j in 0..M-1
+    Storage:
+        data is a single contiguous float64 numpy array of shape (M, N), time is a 1-D float64 array
+        or, for uniformly sampled data, a UniformTime (t0, dt, N) descriptor that behaves like one.
+        Use np.asarray(time) if you need explicit values in one go.
+        Indexing (data[j][i], data[j,i], len(data), time[i]) works as with the old lists
+        and in-place edits are fine, but columns cannot be .append()-ed to directly.
+        Use the append_xxx methods, or as_lists() if you really need plain python lists.
     Also provides storage space for extras:
         colID    - textual name for every column (including time if present). Should match width.
         comments - some data formats provide comment entries
@@ -48,10 +59,15 @@ class TabData:
     some NOTE s:
     In general a "perfect rectangle" data layout is expected. However sometimes
     an uneven csv file is passed or we may need to combine files with different column length.
-    A basic provision (essentially via lax checks) is made in order to try to support this.
+    A basic provision (essentially via lax checks) is made in order to try to support this:
+    with strict_rect=False shorter columns are padded with NaN up to the common length.
     Core funtionality focuses on IO only anyway and does not hide data.
     So all the implementation details of data mangling is up to the final scripts..
     """
+    _buf = None # growth buffer backing data, see _grow
+    _stats = None # (data, ColumnStats) cache, see stats
+    _lazy = None # LazyColumns of a lazily read table (not decoded yet), see column
+
     def __init__(self, no_time=False, strict_rect=True):
         """Empty field constructor based on generic data model.
         Parameters:
@@ -64,43 +80,133 @@ class TabData:
         self.comments = []  # some formats may allow a few lines of comments at the top
         self.headers  = []  # some descriptive info of consequence
         self.colID = []  # list of strings representing column names, should match data[+time] in size :- colID[0] == time header, if time is present
-        self.data  = []  # list of columns, each holding a single "vector" - list of values
+        self.data  = np.empty((0,0))  # 2-D array of columns, each row holding a single "vector" of values
         if not no_time:
-            self.time = [] # most files are gonna have special 1st column;
+            self.time = np.empty(0) # most files are gonna have special 1st column;
 
 
+    @property
+    def data(self):
+        """2-D array of columns, see the class docstring.
+        A lazily read table (readers with lazy=True) gets all its columns decoded on first access.
+        Writable data may be edited in place once handed out, so that drops the cached stats
+        (read-only data - views, cache hits - keeps them). Internals only reading data use _data.
+        """
+        if self._lazy is not None:
+            self._data = self._lazy.materialize()
+            self._lazy = None
+        if self._stats is not None and self._data.flags.writeable:
+            self._stats = None
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        self._data = value
+        self._lazy = None
+
+    @property
+    def time(self):
+        """time column, see the class docstring (AttributeError if there is none).
+        A UniformTime is handed out bound to this table, see UniformTime.__setitem__.
+        """
+        time = self._time
+        if isinstance(time, UniformTime) and (time._owner is None or time._owner() is not self):
+            # shared with another table (copy.copy) or just assigned
+            time = self._time = time.bound(self)
+        return time
+
+    @time.setter
+    def time(self, value):
+        self._time = value
+
+    @time.deleter
+    def time(self):
+        # drops the time column, has_time() is False afterwards
+        del self._time
+
+    def column(self, j):
+        """data column j (counting from the 1st data column, as data[j]).
+        For a lazily read table only this column is decoded (once, it is kept afterwards),
+        the rest stays as text until data itself is used. Such columns are read-only.
+        """
+        if self._lazy is not None:
+            return self._lazy.column(j)
+        return self._data[j]
+
     @property
     def Npts(self):
         """the length of data - N points (or rows).
-        NOTE: this assumes "perfect rectangle" (and thus just returns length of data[0]),
-        but enfroces no checks. So, getting individual sizes is possible, but has to be done directly
+        NOTE: storage is always rectangular (ragged columns are NaN-padded when strict_rect is off),
+        so this is just the 2nd dimension of data
         """
-        return len(self.data[0])
+        return (self._lazy or self._data).shape[1]
 
     @property
     def Nvars(self):
         "the number of vars (columns) - *not counting* time (1st col)"
-        return len(self.data)
+        return (self._lazy or self._data).shape[0]
 
     def has_time(self):
         "returns bool indicating if time column is present"
         return hasattr(self,"time")
 
+    def as_lists(self):
+        """return (time, data) as plain python lists in the original list-of-columns layout.
+        This is a copy, meant for legacy code that grows columns via list.append;
+        time is None if there is no time column.
+        """
+        time = self.time.tolist() if self.has_time() else None
+        return time, self.data.tolist()
+
+    def stats(self):
+        """per-column summary of data (ColumnStats: min, max, sum, sumsq, count, nans).
+        Computed on first use (or already while reading) and cached; appends keep the cache
+        up to date, assigning new data or getting writable data (see data) drops it.
+        Only edits through a reference to data taken before the stats were computed go unnoticed,
+        call invalidate_stats() after these.
+        """
+        stats = self._cached_stats()
+        if stats is None:
+            stats = column_stats(self.data)
+            self._set_stats(stats)
+        return stats
+
+    def invalidate_stats(self):
+        "drop cached stats, needed after in-place edits through a kept reference to data"
+        self._stats = None
+
+    def _cached_stats(self):
+        "cached stats, if they are still for the current data, None otherwise"
+        if self._stats is not None and self._lazy is None and self._stats[0] is self._data:
+            return self._stats[1]
+        return None
+
+    def _set_stats(self, stats):
+        "cache stats for the current data (None to drop them)"
+        self._stats = (self.data, stats) if stats is not None else None
+
     def max_in_col(self, ncol):
         "returns max value in a given column"
-        return max(self.data[ncol])
+        return self._col_stats(ncol).max[0]
 
     def min_in_col(self, ncol):
         "returns max value in a given column"
-        return min(self.data[ncol])
+        return self._col_stats(ncol).min[0]
+
+    def _col_stats(self, ncol):
+        "ColumnStats of a single column; of a lazily read table, without decoding the other columns"
+        if self._lazy is not None:
+            return column_stats(self.column(ncol)[None])
+        stats = self.stats()
+        return ColumnStats(*(f[ncol:ncol+1] for f in stats._fields()))
 
     def max_data(self):
         "returns overal max value in data"
-        return max(map(max, self.data))
+        return np.fmax.reduce(self.stats().max)
 
     def min_data(self):
         "returns overal max value in data"
-        return min(map(min, self.data))
+        return np.fmin.reduce(self.stats().min)
 
     def change_comments(self, comments, clear=False):
         "append or replace (if clear) by list of comment strings"
@@ -136,13 +242,73 @@ class TabData:
                 dt = self.time[1] - self.time[0]
         if N == 0:
             N = self.Npts
-        # all params set, ready to gerenate
-        self.time=[]
-        for i in range(N):
-            self.time.append(t0 + i*dt)
+        # all params set, ready to gerenate; kept as (t0, dt, N), values are computed on demand
+        self.time = UniformTime(t0, dt, N)
+
+    def _storage(self):
+        """the growth buffer backing self.data, None if there is none
+        (or data was replaced from outside, in which case the old buffer is stale)"""
+        if self._buf is not None and self.data.base is self._buf:
+            return self._buf
+        return None
+
+    def _grow(self, Nvars, Npts, exact = False):
+        """make sure data can grow to (Nvars, Npts) in place, reallocating if needed.
+        A new buffer is Growth_Factor larger than the old one (in the dimension that has to grow),
+        so that repeated appends are amortized O(1) per element. With exact the size is taken as is.
+        Returns the buffer, self.data stays a view of the current size into it.
+        """
+        buf = self._storage()
+        cap = buf.shape if buf is not None else self.data.shape
+        if buf is not None and cap[0] >= Nvars and cap[1] >= Npts:
+            return buf
+        def newcap(need, have):
+            if need <= have:
+                return have
+            return need if exact else max(need, int(have*Growth_Factor))
+        newbuf = np.empty((newcap(Nvars, cap[0]), newcap(Npts, cap[1])))
+        newbuf[:self.Nvars, :self.Npts] = self.data
+        self._buf  = newbuf
+        self.data = newbuf[:self.Nvars, :self.Npts]
+        return newbuf
+
+    def reserve(self, Npts, Nvars = 0):
+        """capacity hint: preallocate room for Npts rows and Nvars columns in total,
+        so that appends up to that size do not reallocate. Never shrinks data.
+        """
+        self._grow(max(Nvars, self.Nvars), max(Npts, self.Npts), exact = True)
+
+    def _pad_to(self, Npts):
+        "NaN-pad all columns up to Npts (lax, non strict_rect mode only)"
+        Nold = self.Npts
+        if Npts > Nold:
+            buf = self._grow(self.Nvars, Npts)
+            buf[:self.Nvars, Nold:Npts] = np.nan
+            self.data = buf[:self.Nvars, :Npts]
+
+    def _add_columns(self, block, shorten):
+        """core of append_column(s): add rows of a 2-D block as new columns (checks are done by callers).
+        If lengths differ, either cut everything to the shortest (shorten, which is just a narrower
+        view, no copies) or NaN-pad to the longest.
+        """
+        Nvars, Nblk = self.Nvars, block.shape[1]
+        stats = self._cached_stats() if Nblk == self.Npts else None
+        self.invalidate_stats()
+        if shorten or (Nblk == self.Npts):
+            Npts = min(self.Npts, Nblk)
+            buf = self._grow(Nvars + len(block), Npts)
+        else:
+            Npts = max(self.Npts, Nblk)
+            self._pad_to(Npts)
+            buf = self._grow(Nvars + len(block), Npts)
+            buf[Nvars:Nvars+len(block), Nblk:Npts] = np.nan
+        buf[Nvars:Nvars+len(block), :min(Npts, Nblk)] = block[:, :Npts]
+        self.data = buf[:Nvars+len(block), :Npts]
+        if stats is not None:
+            self._set_stats(stats.stack(column_stats(block)))
 
     def append_column(self, column, colStr="", shorten=False):
-        """append a passed column = list of numbers to the data.
+        """append a passed column = list (or 1-D array) of numbers to the data.
             If need to append a single column of another tabdata, pass item.data[X]
             or (better) use append_columns..
         colStr - is a string to be passed to colID
@@ -150,17 +316,18 @@ class TabData:
             Then, if True, all columns (including this data object) are shortened to minimal length
             if shorten == False, DimensionMismatch is rased
         """
+        column = np.asarray(column, dtype=np.float64)
         # first do all the checks that can raise exception,
         # so that either all modifications succeed, or we leave our object untouched.
         if (self.colID != []) and (colStr == ""):
             raise TabData_Error
-        if self.data != []:
+        if self.Nvars > 0:
             # explicitly guard empty/new object
             if self.strict_rect and not shorten and (len(column) != self.Npts):
                 raise DimensionMismatch
         #
         # done with checks, start the copy
-        if self.data == []:
+        if self.Nvars == 0:
             # new/empty data, special case
             if colStr != "":
                 # we do have labels/channel names etc.
@@ -170,26 +337,14 @@ class TabData:
                     # pass specific label at creation or something
                     self.colID.append("time (ms)")  # standard for ATF, our most common.
                 self.colID.append(colStr)
-            self.data.append(column)
+            self.data = column.reshape(1,-1).copy()
+            self.invalidate_stats()
         else:
             if self.colID != []:
                 self.colID.append(colStr)
-            #
-            Npts = min(self.Npts, len(column))
-            if (not self.strict_rect) or (len(column) == self.Npts):
-                self.data.append(column)
-            else:
-                # data differ in length and we shorten
-                if len(column) > self.Npts:
-                    # either we shorten a single new column
-                    self.data.append(column[:self.Npts])
-                else:
-                    # or or data is too long, so we reconstruct all data
-                    newdata = []
-                    for old in self.data:
-                        newdata.append(old[:Npts])
-                    newdata.append(column)
-                    self.data = newdata
+            # data differ in length: in strict mode we shorten (either a single new column
+            # or all of our data), in lax mode pad whichever side is shorter
+            self._add_columns(column.reshape(1,-1), self.strict_rect)
 
 
     def append_columns(self, passed, nfirst = 0, ncols = 0, shorten = False):
@@ -203,16 +358,15 @@ class TabData:
         '''
         #print("merging data with {} and {} rows".format(self.Npts, passed.Npts))
         if ncols == 0:
-            nlast = len(passed.data)
+            nlast = passed.Nvars
         else:
             nlast = nfirst + ncols
         #
-        if nlast > len(passed.data):
+        if nlast > passed.Nvars:
             raise TabData_Error
         #
-        pNptsMax = max(map(len,passed.data[nfirst:nlast]))
-        pNptsMin = min(map(len,passed.data[nfirst:nlast]))
-        if self.strict_rect and not shorten and (pNptsMax != self.Npts) and (pNptsMin != self.Npts):
+        pNpts = passed.Npts
+        if self.Nvars > 0 and self.strict_rect and not shorten and (pNpts != self.Npts):
             raise DimensionMismatch
         #
         # set the colID
@@ -224,20 +378,13 @@ class TabData:
             else:
                 self.colID.extend(passed.colID[nfirst:nlast+1])
         #
-        if (not self.strict_rect) or ((pNptsMin == self.Npts) and (pNptsMax == self.Npts)):
-            self.data.extend(passed.data[nfirst:nlast])
+        block = passed.data[nfirst:nlast]
+        if self.Nvars == 0:
+            self.data = block.copy()
+            self._set_stats(passed._cached_stats() if block.shape[0] == passed.Nvars else None)
         else:
-            # need to do length checks here
-            Npts = min(pNptsMin, self.Npts)
-            if Npts < self.Npts:
-                # before appending new data, we need to shorten ours
-                newdata = []
-                for old in self.data:
-                    newdata.append(old[:Npts])
-                self.data = newdata
-            # now we can add new data of appropriate length
-            for i in range(nfirst,nlast):
-                self.data.append(passed.data[i][:Npts])
+            # need to do length checks here: cut both to the shortest in strict mode, pad in lax
+            self._add_columns(block, self.strict_rect)
 
 
     def append_rows(self, passed, at = 0, nfirst = 0, ncols = 0):
@@ -247,7 +394,10 @@ class TabData:
                If not set, then it is responsibility of a caller to handle time separately.
             2. If self.strict_rect then some consistency checks are performed,
                so you can stack only proper complete blocks..
+               Otherwise columns that were not extended are NaN-padded to the new length.
             3. ColIDs are discarded, comments and headers are appended.
+            4. Storage grows geometrically, so repeated appends are cheap; use reserve() if the
+               final size is known.
         NOTE: time is not copied in this code!! (but then it should be refactored anyway..)
         params:
             at: add at this column in self.data
@@ -257,17 +407,14 @@ class TabData:
         '''
         #print("extending data of {}x{} by new block of {}x{} rows".format(self.Nvars,self.Npts, passed.Nvars, passed.Npts))
         if ncols == 0:
-            nlast = len(passed.data)
+            nlast = passed.Nvars
         else:
             nlast = nfirst + ncols
         #
-        if nlast > len(passed.data):
+        if (nlast > passed.Nvars) or (at + nlast - nfirst > self.Nvars):
             raise TabData_Error
         #
-        pNptsMax = max(map(len,passed.data[nfirst:nlast]))
-        pNptsMin = min(map(len,passed.data[nfirst:nlast]))
         if self.strict_rect and (
-                (pNptsMax != pNptsMin ) or
                 (at != 0) or (nfirst != 0)
                 or (nlast != self.Nvars) ):
             raise DimensionMismatch
@@ -276,38 +423,70 @@ class TabData:
         self.comments.extend(passed.comments)
         self.headers.extend(passed.headers)
         # append the data
-        for j in range(nlast-nfirst):
-            self.data[at+j].extend(passed.data[nfirst+j])
+        block = passed.data[nfirst:nlast]
+        Nold, Nnew = self.Npts, self.Npts + passed.Npts
+        stats = self._cached_stats()
+        self.invalidate_stats()
+        if (at == 0) and (nlast - nfirst == self.Nvars):
+            buf = self._grow(self.Nvars, Nnew)
+            buf[:self.Nvars, Nold:Nnew] = block
+            self.data = buf[:self.Nvars, :Nnew]
+            if stats is not None:
+                # merge in stats of the new block, reusing passed's cache if it covers the block
+                bstats = passed._cached_stats() if block.shape[0] == passed.Nvars else None
+                self._set_stats(stats.merge(bstats or column_stats(block)))
+        else:
+            # partial block, only possible in lax mode; NaN-pad the rest
+            self._pad_to(Nnew)
+            self.data[at:at+nlast-nfirst, Nold:] = block
         # if strict_rect then we need to regenerate time, to keep data always consistent
         if self.strict_rect and hasattr(self, "time"):
             self.regenerate_time_uniform()
 
 
-    def extract_rows(self, Nfrom, Nto = 0, do_headers = True):
-        "create a new table with same heders but containing only rows from..to"
+    def view_rows(self, Nfrom, Nto = 0, do_headers = True):
+        """create a new table with same heders but containing only rows from..to, without copying data.
+        The new table is a view: its data/time share memory with ours, so this is O(1) regardless of size.
+        Copy-on-write: the view's arrays are read-only, any appends to it reallocate (so we never
+        see them) and detach() gives it private copies for in-place edits.
+        NOTE: in-place edits done to *this* table after the view was taken do show through.
+        Metadata lists are (shallow) copies, so they can be changed freely.
+        """
         newdat = TabData(not hasattr(self, "time"), self.strict_rect)
-        newdat.colID    = copy.deepcopy(self.colID)
+        newdat.colID = list(self.colID)
         if do_headers:
-            newdat.comments = copy.deepcopy(self.comments)
-            newdat.headers  = copy.deepcopy(self.headers)
-        else:
-            newdat.comments = []
-            newdat.headers  = []
-        # make empty data columns
-        for i in range(self.Nvars):
-            newdat.data.append([])
-        # now extract and carry over proper data..
+            newdat.comments = list(self.comments)
+            newdat.headers  = list(self.headers)
         if Nto == 0:
             Nto = self.Npts
-        for i in range(Nfrom, Nto):
-            for j in range(len(self.data)):
-                #print("i={}, j={}".format(i,j))
-                newdat.data[j].append(self.data[j][i])
-            if hasattr(self, "time"):
-                newdat.time.append(self.time[i])
-        # all done, return constructed object
+        newdat.data = self.data[:, Nfrom:Nto]
+        newdat.data.flags.writeable = False
+        if hasattr(self, "time"):
+            newdat.time = self.time[Nfrom:Nto]
+            if isinstance(newdat.time, np.ndarray):
+                newdat.time.flags.writeable = False
         return newdat
 
+    def extract_rows(self, Nfrom, Nto = 0, do_headers = True):
+        """create a new table with same heders but containing only rows from..to.
+        Data (and explicit time) is a private copy, free to be edited in place.
+        Use view_rows to avoid the copy when the rows are only read.
+        """
+        newdat = self.view_rows(Nfrom, Nto, do_headers)
+        newdat.detach()
+        return newdat
+
+    def is_view(self):
+        "returns bool indicating if data is a read-only view into some other table (see view_rows)"
+        return not self.data.flags.writeable
+
+    def detach(self):
+        "make private copies of viewed data/time, so that they can be edited in place. No-op otherwise"
+        if not self.data.flags.writeable:
+            self.data = self.data.copy()
+        if hasattr(self, "time") and isinstance(self.time, np.ndarray) and not self.time.flags.writeable:
+            self.time = self.time.copy()
+
 
 #######################################################
 #  core class expansion (may be moved to __init__.py ?)
@@ -323,51 +502,398 @@ TabData.write_atf = write_atf
 
 TabData.read_xvg  = read_xvg_gmx
 TabData.write_xvg = write_xvg_gmx
+TabData.iter_xvg_sets = iter_xvg_sets
 
 TabData.read_HEKA_csv  = read_HEKA_csv
+TabData.iter_HEKA_csv  = iter_HEKA_csv
+TabData.read_HEKA_dat  = read_HEKA_dat
+
+TabData.read_abf  = read_abf
+TabData.write_abf = write_abf
+
+# time lookups
+TabData.index_of_time = index_of_time
+TabData.time_window   = time_window
+
+# seeking reads via sidecar row index
+from .tabdata_index import *
+
+TabData.read_indexed = read_indexed
+
+# persistent cache of parsed data
+from .tabdata_cache import *
+from .tabdata_cache import _apply_selection
+
+TabData.load_cached  = load_cached
+TabData.store_cached = store_cached
+
+# parallel parsing of a single file
+from .tabdata_parallel import *
+from .tabdata_parallel import _pool_context
+
+TabData.read_parallel = read_parallel
+TabData.iter_parallel = iter_parallel
+
+# binary format
+from .tabdata_binary import *
+
+TabData.read_tdb  = read_tdb
+TabData.write_tdb = write_tdb
 
 
 # constructor functions
-def from_csv(F, Separator = ',', no_time=False, strict_rect = True):
+# (all of them)
+#   usecols    - read only selected data columns, by index or title pattern (see _select_columns)
+#   row_range  - (Nfrom, Nto) read only these data rows
+#   time_range - (tlo, thi) read only rows in this time window (as in time_window)
+# parsing stops at the end of the row range/time window, see _iter_rows
+def from_csv(F, Separator = ',', no_time=False, strict_rect = True, usecols = None,
+             row_range = None, time_range = None, presize = False, lazy = False):
     "read csv file and return constructed Tabular_Data object"
     data = TabData(no_time = no_time, strict_rect = strict_rect)
-    data.read_csv(F, Separator)
+    data.read_csv(F, Separator, usecols = usecols, row_range = row_range, time_range = time_range,
+                  presize = presize, lazy = lazy)
+    return data
+
+def from_atf(F, strict_rect = True, usecols = None, row_range = None, time_range = None,
+             presize = False, lazy = False):
+    data = TabData(strict_rect = strict_rect)
+    data.read_atf(F, usecols = usecols, row_range = row_range, time_range = time_range,
+                  presize = presize, lazy = lazy)
+    return data
+
+def from_HEKA_csv(F, strict_rect = True, usecols = None, row_range = None, time_range = None,
+                  channels = None):
+    data = TabData(strict_rect = strict_rect)
+    data.read_HEKA_csv(F, usecols = usecols, row_range = row_range, time_range = time_range,
+                       channels = channels)
+    return data
+
+def from_HEKA_dat(F, strict_rect = True, usecols = None, row_range = None, time_range = None,
+                  series = "1.1", sweeps = None, traces = None):
+    data = TabData(strict_rect = strict_rect)
+    data.read_HEKA_dat(F, series, sweeps, traces, usecols = usecols, row_range = row_range,
+                       time_range = time_range)
     return data
 
-def from_atf(F, strict_rect = True):
+def from_xvg(F, strict_rect = True, usecols = None, row_range = None, time_range = None,
+             presize = False, lazy = False, sets = None):
     data = TabData(strict_rect = strict_rect)
-    data.read_atf(F)
+    data.read_xvg(F, usecols = usecols, row_range = row_range, time_range = time_range,
+                  presize = presize, lazy = lazy, sets = sets)
     return data
 
-def from_HEKA_csv(F, strict_rect = True):
+def from_abf(F, strict_rect = True, usecols = None, row_range = None, time_range = None):
     data = TabData(strict_rect = strict_rect)
-    data.read_HEKA_csv(F)
+    data.read_abf(F, usecols = usecols, row_range = row_range, time_range = time_range)
     return data
 
-def from_xvg(F, strict_rect = True):
+def from_tdb(F, strict_rect = True, usecols = None, row_range = None, time_range = None):
     data = TabData(strict_rect = strict_rect)
-    data.read_xvg_gmx(F)
+    data.read_tdb(F, usecols = usecols, row_range = row_range, time_range = time_range)
     return data
 
 
 TabData.constructors = {
     "csv":from_csv,"atf":from_atf,
-    "xvg":from_xvg,"heka_csv":from_HEKA_csv
+    "xvg":from_xvg,"heka_csv":from_HEKA_csv,
+    "tdb":from_tdb,"abf":from_abf,
+    "heka_dat":from_HEKA_dat
     }
 
 TabData.writers = {
     "csv":TabData.write_csv,
     "atf":TabData.write_atf,
-    "xvg":TabData.write_xvg
+    "xvg":TabData.write_xvg,
+    "tdb":TabData.write_tdb,
+    "abf":TabData.write_abf
     }
 
-def from_format(F, fmt, strict_rect = True):
-    "constructs the base structure and read selected format"
-    return TabData.constructors[fmt](F,strict_rect = strict_rect)
+def from_format(F, fmt, strict_rect = True, usecols = None, row_range = None, time_range = None,
+                cache = False, **extras):
+    """constructs the base structure and read selected format
+    usecols    - read only these data columns: index(es) and/or colID patterns, e.g. [0, "*R1"]
+    row_range  - (Nfrom, Nto) read only data rows Nfrom..Nto-1, Nto=None meaning to the end
+    time_range - (tlo, thi) read only rows with tlo <= time < thi, either may be None
+    Parsing stops as soon as the end of the range is reached.
+    cache      - consult the persistent cache of parsed files (see tabdata_cache), if F is a regular file.
+                 A hit gives read-only memory mapped data (see detach), without reading F at all.
+                 A miss on a whole-file read stores the result; selections are then taken from the
+                 cached table, they are not cached themselves.
+    extras     - format specific reader params (e.g. Separator for csv)
+    """
+    path = cache_source(F) if cache else None
+    if path is not None:
+        # different reader params make a different table out of the same file
+        variant = fmt + (":" + repr(sorted(extras.items())) if extras else "")
+        data = TabData(strict_rect = strict_rect)
+        if not data.load_cached(path, variant):
+            data = TabData.constructors[fmt](F,strict_rect = strict_rect, **extras)
+            data.store_cached(path, variant)
+        _apply_selection(data, usecols, row_range, time_range)
+        return data
+    return TabData.constructors[fmt](F,strict_rect = strict_rect, usecols = usecols,
+                                     row_range = row_range, time_range = time_range, **extras)
+
+def from_indexed(path, fmt, strict_rect = True, usecols = None, row_range = None, time_range = None):
+    """read rows of the file at path as from_format does, but if it has an up to date sidecar index
+    (see build_index), seek right to the requested row range/time window instead of parsing up to it.
+    Takes a file name rather than an open file, as the index is found by it.
+    """
+    index = load_index(path, fmt)
+    with open(path) as F:
+        if index is None:
+            return from_format(F, fmt, strict_rect, usecols, row_range, time_range)
+        data = TabData(strict_rect = strict_rect)
+        data.read_indexed(F, fmt, index, usecols, row_range, time_range)
+    return data
+
+def from_parallel(path, fmt, workers = None, strict_rect = True, usecols = None):
+    """read the file at path as from_format does, but parse its data block in a pool of
+    workers processes (N of CPUs if None), see read_parallel. Only pays off for large files,
+    those up to Parallel_Range_Bytes of data are parsed right here anyway.
+    """
+    data = TabData(strict_rect = strict_rect)
+    with open(path) as F:
+        data.read_parallel(F, fmt, workers, usecols)
+    return data
 
-def to_format(self, F, fmt):
-    "unified write in a format passed by fmt"
-    self.writers[fmt](self, F) # as this is not a method, need explicit self routing
+# in-process memo of parsed files: path -> ((size, mtime), table), least recently used first
+_memo = OrderedDict()
+_memo_max_entries = Memo_Max_Entries # raised by load_many to hold all the files it prefetches
+
+def load(path, fmt, strict_rect = True, usecols = None, row_range = None, time_range = None, cache = False,
+         **extras):
+    """memoizing from_format by file name: each file is parsed only once per process
+    (as long as it does not change - size and mtime are checked on every call).
+    The memo is bounded by Memo_Max_Entries (or more, see load_many) and Memo_Max_Bytes,
+    least recently used tables are dropped first.
+    Returns a view of the parsed table (see view_rows), so callers can change metadata and
+    append freely without affecting later loads. usecols/row_range/time_range are applied to the view.
+    cache - also use the persistent cache (see from_format) when parsing
+    """
+    key, stamp = _memo_key(path, fmt, strict_rect, extras)
+    table = _memo_get(key, stamp)
+    if table is None:
+        with open(path) as F:
+            table = from_format(F, fmt, strict_rect, cache = cache, **extras)
+        _memo_put(key, stamp, table)
+    data = table.view_rows(0)
+    _apply_selection(data, usecols, row_range, time_range)
+    return data
+
+def _memo_key(path, fmt, strict_rect, extras):
+    "memo key of a file read with given params and the (size, mtime) stamp it has to match"
+    st = os.stat(path)
+    return (os.path.abspath(path), fmt, strict_rect, repr(sorted(extras.items()))), (st.st_size, st.st_mtime_ns)
+
+def _memo_get(key, stamp):
+    "memoized table, None if there is none or it is out of date"
+    hit = _memo.get(key)
+    if hit is None or hit[0] != stamp:
+        return None
+    _memo.move_to_end(key)
+    return hit[1]
+
+def _memo_put(key, stamp, table):
+    _memo[key] = (stamp, table)
+    _memo.move_to_end(key)
+    _memo_prune()
+
+def _memo_nbytes(table):
+    return table.data.nbytes + (table.time.nbytes if isinstance(getattr(table, "time", None), np.ndarray) else 0)
+
+def _memo_prune():
+    "drop least recently used tables until the memo is within its bounds (the latest one always stays)"
+    total = sum(_memo_nbytes(t) for stamp, t in _memo.values())
+    while len(_memo) > 1 and (len(_memo) > _memo_max_entries or total > Memo_Max_Bytes):
+        stamp, t = _memo.popitem(last = False)[1]
+        total -= _memo_nbytes(t)
+
+def memo_clear():
+    "forget all tables memoized by load"
+    _memo.clear()
+
+def _parse_file(path, fmt, strict_rect, usecols, row_range, time_range, cache, extras):
+    "load_many worker: parse a single file (in a pool process, the table is pickled back)"
+    with open(path) as F:
+        return from_format(F, fmt, strict_rect, usecols, row_range, time_range, cache, **extras)
+
+def load_many(paths, fmt, workers = None, strict_rect = True, usecols = None, row_range = None,
+              time_range = None, cache = False, memo = False, **extras):
+    """parse many files in a pool of worker processes, returning the tables in paths order.
+    workers - N of processes, default is N of CPUs; 1 (or a single file) parses right here.
+    Tables come back pickled, where numpy arrays travel as raw buffers, so the transfer is
+    about a memory copy per table; everything else is as in from_format.
+    memo - put whole tables into the memo of load (skipping files already there) and return
+           views of them as load does, so later loads of these files are free. The memo is made to
+           hold at least as many tables as there are paths, so that the prefetch does not evict itself;
+           Memo_Max_Bytes still applies.
+    """
+    if memo:
+        global _memo_max_entries
+        paths = list(paths)
+        _memo_max_entries = max(_memo_max_entries, len(set(paths)))
+        todo = []
+        for path in dict.fromkeys(paths):
+            key, stamp = _memo_key(path, fmt, strict_rect, extras)
+            if _memo_get(key, stamp) is None:
+                todo.append((path, key, stamp))
+        parse = functools.partial(_parse_file, fmt = fmt, strict_rect = strict_rect, usecols = None,
+                                  row_range = None, time_range = None, cache = cache, extras = extras)
+        for (path, key, stamp), table in zip(todo, _map_files(parse, [t[0] for t in todo], workers)):
+            _memo_put(key, stamp, table)
+        return [load(path, fmt, strict_rect, usecols, row_range, time_range, cache, **extras) for path in paths]
+    parse = functools.partial(_parse_file, fmt = fmt, strict_rect = strict_rect, usecols = usecols,
+                              row_range = row_range, time_range = time_range, cache = cache, extras = extras)
+    return _map_files(parse, paths, workers)
+
+def _map_files(parse, paths, workers):
+    "parse(path) for all paths, in a process pool unless there is just one worker or file"
+    if workers == 1 or len(paths) < 2:
+        return [parse(path) for path in paths]
+    # same pool as in tabdata_parallel, see the note there
+    with (_pool_context() or multiprocessing).Pool(workers) as pool:
+        return pool.map(parse, paths)
+
+# batch combination, final size is computed first and every input is copied exactly once
+def concat_rows(tables, strict_rect = True):
+    """stack tables one after another (row-wise), like repeated append_rows but in a single pass.
+    colID is taken from the 1st table, comments and headers are collected from all.
+    Time (if the 1st table has it) is regenerated as uniform from the 1st table in strict_rect mode,
+    otherwise time values of all tables are concatenated as they are.
+    In strict mode all tables must have the same Nvars, otherwise shorter ones are NaN-padded.
+    """
+    first = tables[0]
+    Nvars = max(t.Nvars for t in tables)
+    if strict_rect and any(t.Nvars != Nvars for t in tables):
+        raise DimensionMismatch
+    newdat = TabData(not first.has_time(), strict_rect)
+    newdat.colID = list(first.colID)
+    newdat.data  = np.empty((Nvars, sum(t.Npts for t in tables)))
+    if not strict_rect:
+        newdat.data.fill(np.nan)
+    i = 0
+    for t in tables:
+        newdat.data[:t.Nvars, i:i+t.Npts] = t.data
+        i += t.Npts
+        newdat.comments.extend(t.comments)
+        newdat.headers.extend(t.headers)
+    stats = [t._cached_stats() for t in tables]
+    if strict_rect and None not in stats:
+        merged = stats[0]
+        for st in stats[1:]:
+            merged = merged.merge(st)
+        newdat._set_stats(merged)
+    if first.has_time():
+        if strict_rect:
+            newdat.time = first.time
+            newdat.regenerate_time_uniform()
+        else:
+            newdat.time = np.concatenate([np.asarray(t.time) for t in tables])
+    return newdat
+
+def concat_columns(tables, shorten = False, strict_rect = True):
+    """put tables side by side (column-wise), like repeated append_columns but in a single pass.
+    Time, comments and headers come from the 1st table, colID is combined from all of them.
+    Differing lengths raise DimensionMismatch in strict mode, unless shorten (cut to the shortest);
+    in lax mode shorter columns are NaN-padded.
+    """
+    first = tables[0]
+    if strict_rect:
+        if not shorten and any(t.Npts != first.Npts for t in tables):
+            raise DimensionMismatch
+        Npts = min(t.Npts for t in tables)
+    else:
+        Npts = max(t.Npts for t in tables)
+    newdat = TabData(not first.has_time(), strict_rect)
+    newdat.comments = list(first.comments)
+    newdat.headers  = list(first.headers)
+    newdat.colID    = list(first.colID)
+    for t in tables[1:]:
+        # colIDs of data columns only, time label is there just once
+        newdat.colID.extend(t.colID[1:] if t.has_time() else t.colID)
+    newdat.data = np.empty((sum(t.Nvars for t in tables), Npts))
+    if not strict_rect:
+        newdat.data.fill(np.nan)
+    j = 0
+    for t in tables:
+        n = min(Npts, t.Npts)
+        newdat.data[j:j+t.Nvars, :n] = t.data[:, :n]
+        j += t.Nvars
+    stats = [t._cached_stats() for t in tables]
+    if all(t.Npts == Npts for t in tables) and None not in stats:
+        stacked = stats[0]
+        for st in stats[1:]:
+            stacked = stacked.stack(st)
+        newdat._set_stats(stacked)
+    if first.has_time():
+        newdat.time = first.time[:Npts] if len(first.time) >= Npts else first.time
+    return newdat
+
+TabData.concat_rows    = staticmethod(concat_rows)
+TabData.concat_columns = staticmethod(concat_columns)
+
+
+def to_format(self, F, fmt, **extras):
+    "unified write in a format passed by fmt, extras are passed on to the writer (fmt, header, ..)"
+    self.writers[fmt](self, F, **extras) # as this is not a method, need explicit self routing
     return
 
 TabData.to_format = to_format
+
+
+# chunked (streaming) readers
+# Formats that store data column after column (heka_csv, heka_dat, abf) cannot be streamed by rows,
+# so they are not listed here.
+TabData.chunk_readers = {
+    "csv":iter_csv, "atf":iter_atf,
+    "xvg":iter_xvg_gmx, "tdb":iter_tdb
+    }
+
+def iter_chunks(F, fmt, rows = Bulk_Block_Rows, strict_rect = True, usecols = None,
+                row_range = None, time_range = None):
+    """generator reading F in blocks of up to rows rows, each returned as a separate TabData.
+    Headers are parsed once (when this is called) and shared by all chunks (same colID/comments/headers
+    lists), so only a single block of data is kept in memory at any time. Typical use:
+        for chunk in iter_chunks(F, "atf", 100000):
+            ... process chunk.data, chunk.time
+    """
+    if fmt not in TabData.chunk_readers:
+        raise FormatMismatch("format {} cannot be read in chunks".format(fmt))
+    data = TabData(strict_rect = strict_rect)
+    return TabData.chunk_readers[fmt](data, F, rows, usecols = usecols,
+                                      row_range = row_range, time_range = time_range)
+
+TabData.iter_chunks = staticmethod(iter_chunks)
+
+def convert(Fin, fmt_in, Fout, fmt_out, rows = Bulk_Block_Rows, workers = 1):
+    """stream Fin in format fmt_in into Fout in format fmt_out, one chunk of rows rows at a time.
+    Memory use is bounded by the chunk size and output starts right away.
+    Formats without a chunk reader (heka_csv, heka_dat, abf) are read as a whole first, abf output needs it too.
+    workers - parse in a pool of processes (None - N of CPUs, see iter_parallel) if Fin is a regular file,
+              chunks then are byte ranges of about Parallel_Range_Bytes rather than rows rows.
+    """
+    if fmt_out not in TabData.writers:
+        raise FormatMismatch("cannot write format {}".format(fmt_out))
+    if fmt_out == "abf":
+        # sweeps are stored one after another, so abf is written from the whole table
+        from_format(Fin, fmt_in).write_abf(Fout)
+        return
+    if workers != 1 and fmt_in in Indexed_Formats and cache_source(Fin):
+        chunks = TabData().iter_parallel(Fin, fmt_in, workers)
+    elif fmt_in in TabData.chunk_readers:
+        chunks = iter_chunks(Fin, fmt_in, rows)
+    else:
+        chunks = [from_format(Fin, fmt_in)]
+    if fmt_out == "tdb":
+        # written in a single pass too, but the metadata goes at the end
+        W = TdbWriter(Fout)
+        for chunk in chunks:
+            W.append(chunk)
+        W.close()
+        return
+    header = True
+    for chunk in chunks:
+        chunk.to_format(Fout, fmt_out, header = header)
+        header = False
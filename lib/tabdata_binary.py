@@ -0,0 +1,313 @@
+#
+# Binary TabData format (tdb) - the internal interchange format between pipeline stages
+# Copyright (C) 2018  George Shapovalov <gshapovalov@gmail.com>
+#
+# Text formats have to be parsed (and decimal strings converted) on every load. A tdb file keeps
+# the values as they are in memory, so reading is just copying bytes, and is laid out so that
+# a single column or a window of rows can be read without touching the rest:
+#
+#   magic (8 bytes)
+#   chunks: rows are split into chunks of Tdb_Chunk_Rows, each stores every column (and explicit
+#           time, if any) as a separate block of little endian float64, optionally zlib compressed
+#   metadata: json with colID, comments, headers, time (null, "array" or UniformTime params),
+#           column stats and the chunk index (1st row, N of rows, offset/size of every block)
+#   footer: metadata offset and size (2 x uint64 le) and the magic again
+#
+# Offsets are counted from the start of the tdb data, so files can be written to pipes,
+# but reading needs a seekable file. Everything is written in a single pass, so tables can be
+# streamed out chunk by chunk (TdbWriter, used by convert).
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import io, sys, copy, json, struct, zlib
+import numpy as np
+from .tabdata_common import *
+from .tabdata_time import UniformTime, uniform_time
+from .tabdata_stats import ColumnStats, column_stats
+from .tabdata_io import _select_columns, _binary, _check_window, _row_window
+
+Tdb_Magic = b"TABDATA\x01"
+_footer = struct.Struct("<QQ8s")
+
+
+class TdbWriter:
+    """write a table into a tdb file F piece by piece:
+        W = TdbWriter(F)
+        for chunk in ...:
+            W.append(chunk)
+        W.close()
+    Metadata (colID etc) is taken from the 1st appended table. Time is kept as UniformTime
+    params as long as all the appended pieces continue it, otherwise it is stored explicitly.
+        compress   - None or "zlib" (per column per chunk, level compress_level)
+        chunk_rows - rows per chunk, appended tables are split or merged to this size
+    """
+    def __init__(self, F, compress = None, chunk_rows = Tdb_Chunk_Rows, compress_level = 6):
+        if compress not in (None, "zlib"):
+            raise TDB_Error("unknown compression {}".format(compress))
+        self.F = _binary(F)
+        self.compress = compress
+        self.level = compress_level
+        self.chunk_rows = int(chunk_rows)
+        self.meta = None
+        self.chunks = []
+        self.pending = [] # (time, data) pieces not making up a full chunk yet
+        self.Npending = 0
+        self.Npts = 0
+        self.utime = None # UniformTime describing all the time written so far, if it does
+        self.refits = 4
+        self.stats = None
+        self.pos = 0
+        self._write(Tdb_Magic)
+
+    def _write(self, buf):
+        self.F.write(buf)
+        self.pos += len(buf)
+
+    def _block(self, values):
+        "write a column block, return its (offset, size)"
+        buf = np.ascontiguousarray(values, dtype="<f8").tobytes()
+        if self.compress == "zlib":
+            buf = zlib.compress(buf, self.level)
+        offset = self.pos
+        self._write(buf)
+        return [offset, len(buf)]
+
+    def append(self, table):
+        "add rows of table (must have the same columns and time presence as the 1st one)"
+        if self.meta is None:
+            self.meta = {"version":1, "colID":list(table.colID), "comments":list(table.comments),
+                         "headers":list(table.headers), "Nvars":table.Nvars,
+                         "time":"none" if not table.has_time() else None}
+        if table.Nvars != self.meta["Nvars"] or table.has_time() != (self.meta["time"] != "none"):
+            raise DimensionMismatch
+        if table.Npts == 0:
+            return
+        time = table.time if table.has_time() else None
+        self._check_time(time)
+        self.pending.append((time, table.data))
+        self.Npending += table.Npts
+        while self.Npending >= self.chunk_rows:
+            self._flush(self.chunk_rows)
+
+    def _check_time(self, time):
+        """keep utime up to date, switching to explicit time once it stops describing the time written.
+        Time of a piece may fit a uniform axis on its own (uniform_time) but not continue the one
+        fitted so far (e.g. rounding shows only later on), then all of it is fitted again, a few times at most.
+        """
+        if time is None or self.meta["time"] == "array":
+            return
+        N, n = self.Npts + self.Npending, len(time)
+        if N == 0:
+            self.utime = time.resized(0) if isinstance(time, UniformTime) else UniformTime(time[0], 0, 0)
+        cont = self.utime.resized(N + n)[N:]
+        if isinstance(time, UniformTime) and (time.t0, time.dt, time.i0, time.decimals) == \
+                                             (cont.t0, cont.dt, cont.i0, cont.decimals):
+            self.utime = self.utime.resized(N + n)
+            return
+        if np.array_equal(cont.materialize(), np.asarray(time)):
+            self.utime = self.utime.resized(N + n)
+            return
+        if self.refits > 0:
+            self.refits -= 1
+            utime = uniform_time(np.concatenate((self.utime.materialize(), np.asarray(time))))
+            if isinstance(utime, UniformTime):
+                self.utime = utime
+                return
+        # not uniform after all: store time of the chunks written so far explicitly
+        for ch in self.chunks:
+            ch["time"] = self._block(self.utime[ch["row"]:ch["row"] + ch["rows"]])
+        self.utime = None
+        self.meta["time"] = "array"
+
+    def _flush(self, n):
+        "write out a chunk of the first n pending rows"
+        parts, taken = [], 0
+        while taken < n:
+            time, data = self.pending[0]
+            k = min(n - taken, data.shape[1])
+            parts.append((time[:k] if time is not None else None, data[:, :k]))
+            if k == data.shape[1]:
+                self.pending.pop(0)
+            else:
+                self.pending[0] = (time[k:] if time is not None else None, data[:, k:])
+            taken += k
+        data = parts[0][1] if len(parts) == 1 else np.concatenate([p[1] for p in parts], axis=1)
+        chunk = {"row":self.Npts, "rows":n, "columns":[self._block(col) for col in data]}
+        if self.meta["time"] == "array":
+            chunk["time"] = self._block(np.concatenate([np.asarray(p[0]) for p in parts]))
+        self.chunks.append(chunk)
+        st = column_stats(data)
+        self.stats = st if self.stats is None else self.stats.merge(st)
+        self.Npts += n
+        self.Npending -= n
+
+    def close(self):
+        "write out the rest of rows and the metadata; F itself is left open"
+        if self.meta is None:
+            raise TDB_Error("nothing to write")
+        if self.Npending:
+            self._flush(self.Npending)
+        meta = self.meta
+        meta["Npts"] = self.Npts
+        meta["compress"] = self.compress
+        meta["chunks"] = self.chunks
+        if meta["time"] is None:
+            # all time is uniform (or there are no rows at all)
+            t = self.utime if self.utime is not None else UniformTime(0, 0, 0)
+            meta["time"] = [t.t0, t.dt, t.N, t.i0, t.decimals]
+        if self.stats is not None:
+            st = self.stats
+            meta["stats"] = [f.tolist() for f in (st.min, st.max, st.sum, st.sumsq)] + \
+                            [st.count.tolist(), st.nans.tolist()]
+        buf = json.dumps(meta).encode()
+        offset = self.pos
+        self._write(buf)
+        self._write(_footer.pack(offset, len(buf), Tdb_Magic))
+        self.F.flush()
+
+
+def write_tdb(self, F, compress = None, chunk_rows = Tdb_Chunk_Rows, header = True):
+    """write the table as a tdb file, see TdbWriter for params.
+    header is only accepted for the sake of convert and the like: tdb files are written whole
+    (use TdbWriter to write one piece by piece).
+    """
+    if not header:
+        raise TDB_Error("tdb cannot be appended to, use TdbWriter")
+    W = TdbWriter(F, compress, chunk_rows)
+    W.append(self)
+    W.close()
+
+
+def _read_meta(B):
+    "read the metadata of a tdb file open as binary B, return (meta, base offset)"
+    try:
+        end = B.seek(0, io.SEEK_END)
+    except (OSError, io.UnsupportedOperation):
+        raise TDB_Error("tdb can only be read from a seekable file")
+    if end < len(Tdb_Magic) + _footer.size:
+        raise TDB_Error("not a tdb file (too short)")
+    B.seek(end - _footer.size)
+    offset, size, magic = _footer.unpack(B.read(_footer.size))
+    if magic != Tdb_Magic:
+        raise TDB_Error("not a tdb file")
+    start = end - _footer.size - size
+    B.seek(start)
+    meta = json.loads(B.read(size).decode())
+    base = start - offset
+    B.seek(base)
+    if B.read(len(Tdb_Magic)) != Tdb_Magic:
+        raise TDB_Error("damaged tdb file")
+    return meta, base
+
+def _read_values(B, base, meta, block, a, b, out):
+    "read values a..b (counting within the chunk) of a column block into out"
+    offset, size = block
+    B.seek(base + offset + (8*a if meta["compress"] is None else 0))
+    if meta["compress"] is None:
+        if sys.byteorder == "little":
+            n = B.readinto(memoryview(out).cast("B"))
+        else:
+            buf = B.read(8*(b - a))
+            n = len(buf)
+            out[:] = np.frombuffer(buf, dtype="<f8")
+        if n != 8*(b - a):
+            raise TDB_Error("truncated tdb file")
+    else:
+        out[:] = np.frombuffer(zlib.decompress(B.read(size)), dtype="<f8")[a:b]
+
+def _read_rows(B, base, meta, dcols, Nfrom, Nto, with_time):
+    "time (if with_time and it is explicit) and data (columns dcols) of rows Nfrom..Nto"
+    data = np.empty((len(dcols), Nto - Nfrom))
+    time = np.empty(Nto - Nfrom) if with_time else None
+    for ch in meta["chunks"]:
+        r0 = ch["row"]
+        a, b = max(Nfrom, r0), min(Nto, r0 + ch["rows"])
+        if a >= b:
+            continue
+        for j, c in enumerate(dcols):
+            _read_values(B, base, meta, ch["columns"][c], a - r0, b - r0, data[j, a-Nfrom:b-Nfrom])
+        if with_time:
+            _read_values(B, base, meta, ch["time"], a - r0, b - r0, time[a-Nfrom:b-Nfrom])
+    return time, data
+
+def _tdb_setup(self, F, usecols, row_range, time_range):
+    """read the metadata and headers of the tdb file F into self and work out what to read:
+    returns (B, base, meta, dcols, Nfrom, Nto) with dcols - data columns to read, Nfrom..Nto - rows.
+    A uniform time is set right away (the whole one), explicit time is read only if the window needs it.
+    """
+    B = _binary(F)
+    meta, base = _read_meta(B)
+    self.colID    = list(meta["colID"])
+    self.comments = list(meta["comments"])
+    self.headers  = list(meta["headers"])
+    Npts, Nvars = meta["Npts"], meta["Nvars"]
+    if meta["time"] == "none":
+        if self.has_time():
+            del self.time
+    elif meta["time"] != "array":
+        self.time = UniformTime(*meta["time"])
+    _check_window(self, time_range)
+    ntime = 0 if meta["time"] == "none" else 1
+    cols = _select_columns(self, Nvars + ntime, usecols)
+    dcols = list(range(Nvars)) if cols is None else [c - ntime for c in cols[ntime:]]
+    if time_range is not None and meta["time"] == "array":
+        self.time = _read_rows(B, base, meta, [], 0, Npts, True)[0]
+    Nfrom, Nto = _row_window(self, Npts, row_range, time_range)
+    return B, base, meta, dcols, Nfrom, Nto
+
+def _tdb_stats(meta, dcols):
+    "stats of the (whole) columns dcols from the metadata, None if there are none"
+    st = meta.get("stats")
+    if not st:
+        return None
+    fields = [np.array(a, dtype=np.float64) for a in st[:4]] + [np.array(a, dtype=np.int64) for a in st[4:]]
+    return ColumnStats(*(f[dcols] for f in fields))
+
+def _set_rows(self, B, base, meta, Nfrom, Nto, dcols):
+    "fill self.time/self.data with rows Nfrom..Nto"
+    time, data = _read_rows(B, base, meta, dcols, Nfrom, Nto, meta["time"] == "array")
+    if meta["time"] == "array":
+        self.time = time
+    elif meta["time"] != "none":
+        self.time = UniformTime(*meta["time"])[Nfrom:Nto]
+    self.data = data
+
+def read_tdb(self, F, usecols = None, row_range = None, time_range = None):
+    """read a tdb file (open, binary or text mode, has to be seekable).
+    Only the requested columns and rows are read (see _select_columns and _iter_rows for the params),
+    of uncompressed files just the bytes holding them.
+    """
+    B, base, meta, dcols, Nfrom, Nto = _tdb_setup(self, F, usecols, row_range, time_range)
+    _set_rows(self, B, base, meta, Nfrom, Nto, dcols)
+    if (Nfrom, Nto) == (0, meta["Npts"]):
+        self._set_stats(_tdb_stats(meta, dcols))
+
+def iter_tdb(self, F, rows, usecols = None, row_range = None, time_range = None):
+    """chunked reader of tdb files, see read_tdb and iter_chunks.
+    The file is checked and its metadata read right away (as the text chunk readers do with headers),
+    returns a generator of the chunks.
+    """
+    B, base, meta, dcols, Nfrom, Nto = _tdb_setup(self, F, usecols, row_range, time_range)
+    return _tdb_chunks(self, B, base, meta, dcols, Nfrom, Nto, rows)
+
+def _tdb_chunks(self, B, base, meta, dcols, Nfrom, Nto, rows):
+    "generator behind iter_tdb: rows Nfrom..Nto in chunks of up to rows rows, shallow copies of self"
+    if Nfrom >= Nto:
+        yield copy.copy(self)
+        return
+    for a in range(Nfrom, Nto, rows):
+        chunk = copy.copy(self)
+        _set_rows(chunk, B, base, meta, a, min(a + rows, Nto), dcols)
+        yield chunk
@@ -0,0 +1,202 @@
+#
+# Persistent on-disk cache of parsed TabData
+# Copyright (C) 2018  George Shapovalov <gshapovalov@gmail.com>
+#
+# Parsing text is by far the slowest part of working with our files, and the same files get
+# parsed over and over. Parsed tables are kept here as raw .npy arrays (loaded back memory mapped,
+# so a hit costs about as much as opening the files) plus a json file with everything else.
+# Entries are keyed by path, size, mtime, format and a hash of the head and tail of the file,
+# so an edited file simply misses. The cache is pruned by size, least recently used first.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os, json, hashlib, time
+import numpy as np
+from .tabdata_common import *
+from .tabdata_time import UniformTime
+from .tabdata_stats import ColumnStats
+from .tabdata_io import _select_columns, _file_path, _check_window
+
+
+def cache_dir():
+    "location of the cache, $TABDATA_CACHE or ~/.cache/tabdata"
+    return os.environ.get(Cache_Dir_Env) or os.path.join(os.path.expanduser("~"), ".cache", "tabdata")
+
+def cache_source(F):
+    "the path of the regular file behind an open file F, None if there is none (pipes, stdin, StringIO..)"
+    path = _file_path(F)
+    return os.path.abspath(path) if path is not None else None
+
+def cache_key(path, fmt):
+    "cache key of a data file: hash of its path, size, mtime, format and the head and tail of its contents"
+    st = os.stat(path)
+    h = hashlib.sha1("{}\0{}\0{}\0{}".format(os.path.abspath(path), st.st_size, st.st_mtime_ns, fmt).encode())
+    with open(path, "rb") as F:
+        h.update(F.read(Cache_Hash_Bytes))
+        if st.st_size > 2*Cache_Hash_Bytes:
+            F.seek(-Cache_Hash_Bytes, os.SEEK_END)
+            h.update(F.read())
+    return h.hexdigest()
+
+def _entry_files(key):
+    "(metadata, data, time) file names of a cache entry"
+    base = os.path.join(cache_dir(), key)
+    return base + ".json", base + ".npy", base + ".time.npy"
+
+
+def load_cached(self, path, fmt):
+    """mix-in: fill self from the cache entry of the file at path, if there is one; returns bool.
+    data (and explicit time) are read-only memory maps of the cached arrays (see is_view/detach).
+    """
+    key = cache_key(path, fmt)
+    fmeta, fdata, ftime = _entry_files(key)
+    try:
+        with open(fmeta) as F:
+            meta = json.load(F)
+        data = np.load(fdata, mmap_mode = "r")
+        if meta["time"] == "array":
+            timecol = np.load(ftime, mmap_mode = "r")
+    except (OSError, ValueError, KeyError):
+        return False
+    self.colID    = meta["colID"]
+    self.comments = meta["comments"]
+    self.headers  = meta["headers"]
+    self.data = data
+    if meta["time"] is None:
+        if self.has_time():
+            del self.time
+    elif meta["time"] == "array":
+        self.time = timecol
+    else:
+        self.time = UniformTime(*meta["time"])
+    if meta.get("stats"):
+        st = meta["stats"]
+        self._set_stats(ColumnStats(*[np.array(a, dtype=np.float64) for a in st[:4]],
+                                    *[np.array(a, dtype=np.int64) for a in st[4:]]))
+    # mark as recently used
+    os.utime(fmeta)
+    return True
+
+def store_cached(self, path, fmt):
+    """mix-in: put self (as just read from the file at path) into the cache, then prune it.
+    Files are written under temporary names and renamed, metadata last, so readers never see
+    partial entries.
+    """
+    key = cache_key(path, fmt)
+    fmeta, fdata, ftime = _entry_files(key)
+    os.makedirs(cache_dir(), exist_ok = True)
+    meta = {"path":os.path.abspath(path), "fmt":fmt, "size":os.stat(path).st_size,
+            "colID":self.colID, "comments":self.comments, "headers":self.headers, "time":None}
+    tmp = ".{}.tmp".format(os.getpid())
+    _save_array(fdata, tmp, np.ascontiguousarray(self.data))
+    if self.has_time():
+        if isinstance(self.time, UniformTime):
+            t = self.time
+            meta["time"] = [t.t0, t.dt, t.N, t.i0, t.decimals]
+        else:
+            meta["time"] = "array"
+            _save_array(ftime, tmp, np.asarray(self.time, dtype=np.float64))
+    stats = self.stats()
+    meta["stats"] = [f.tolist() for f in (stats.min, stats.max, stats.sum, stats.sumsq)] + \
+                    [stats.count.tolist(), stats.nans.tolist()]
+    with open(fmeta + tmp, "w") as F:
+        json.dump(meta, F)
+    os.replace(fmeta + tmp, fmeta)
+    cache_prune()
+
+def _save_array(name, tmp, arr):
+    "np.save under a temporary name, then rename into place"
+    with open(name + tmp, "wb") as F:
+        np.save(F, arr)
+    os.replace(name + tmp, name)
+
+
+def _apply_selection(self, usecols = None, row_range = None, time_range = None):
+    """narrow down an already loaded table as the readers would do while reading
+    (see _select_columns and _iter_rows for the params). Rows come as views, columns are copied.
+    """
+    if usecols is not None:
+        ntime = 1 if self.has_time() else 0
+        cols = _select_columns(self, self.Nvars + ntime, usecols)
+        if cols is not None:
+            self.data = self.data[[c - ntime for c in cols[ntime:]]]
+    Nfrom, Nto = 0, self.Npts
+    if row_range is not None:
+        Nfrom = min(row_range[0], Nto)
+        if row_range[1] is not None:
+            Nto = max(Nfrom, min(row_range[1], Nto))
+    if time_range is not None:
+        _check_window(self, time_range)
+        Il, Ih = self.time_window(*time_range)
+        Nfrom, Nto = max(Nfrom, Il), max(Nfrom, min(Nto, Ih))
+    if (Nfrom, Nto) != (0, self.Npts):
+        self.data = self.data[:, Nfrom:Nto]
+        if self.has_time():
+            self.time = self.time[Nfrom:Nto]
+
+
+def cache_entries():
+    """list of cache entries as dicts with the source path, fmt, size (of the source file),
+    bytes (taken in the cache), used (last use time) and key; most recently used first.
+    """
+    entries = []
+    cdir = cache_dir()
+    if not os.path.isdir(cdir):
+        return entries
+    for name in os.listdir(cdir):
+        if not name.endswith(".json"):
+            continue
+        key = name[:-5]
+        fmeta, fdata, ftime = _entry_files(key)
+        try:
+            with open(fmeta) as F:
+                meta = json.load(F)
+            used = os.stat(fmeta).st_mtime
+        except (OSError, ValueError):
+            continue
+        nbytes = sum(os.path.getsize(f) for f in (fmeta, fdata, ftime) if os.path.exists(f))
+        entries.append({"key":key, "path":meta.get("path"), "fmt":meta.get("fmt"),
+                        "size":meta.get("size"), "bytes":nbytes, "used":used})
+    entries.sort(key = lambda e: e["used"], reverse = True)
+    return entries
+
+def cache_remove(key):
+    "drop a single cache entry"
+    for f in _entry_files(key):
+        try:
+            os.remove(f)
+        except FileNotFoundError:
+            pass
+
+def cache_prune(max_bytes = Cache_Max_Bytes):
+    "drop least recently used entries until the cache takes at most max_bytes; returns N of dropped"
+    total, dropped = 0, 0
+    for e in cache_entries():
+        total += e["bytes"]
+        if total > max_bytes:
+            cache_remove(e["key"])
+            dropped += 1
+    # leftovers of interrupted writes
+    cdir = cache_dir()
+    if os.path.isdir(cdir):
+        for name in os.listdir(cdir):
+            fname = os.path.join(cdir, name)
+            if name.endswith(".tmp") and time.time() - os.path.getmtime(fname) > 3600:
+                os.remove(fname)
+    return dropped
+
+def cache_clear():
+    "drop all cache entries"
+    return cache_prune(0)
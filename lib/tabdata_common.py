@@ -29,6 +29,9 @@ class CSV_Error(TabData_Error):
 class HEKA_CSV_Error(FormatMismatch):
     """Error with the data format in HEKA csv file."""
     pass
+class HEKA_DAT_Error(FormatMismatch):
+    """Error with the data format in HEKA PatchMaster (.dat bundle) file."""
+
 class ATF_Error(FormatMismatch):
     """Error with the data format in atf file."""
     pass
@@ -36,9 +39,42 @@ class XVG_Error(FormatMismatch):
     """Error with the data format in xvg (xmgrace) file."""
     pass
 
+class ABF_Error(FormatMismatch):
+    """Error with the data format in abf (Axon binary) file."""
+
+class TDB_Error(FormatMismatch):
+    """Error with the data format in tdb (binary TabData) file."""
+
 class DimensionMismatch(TabData_Error):
     "a subclass for exceptions when pairing two tables of incompatibel dimensions"
 
+class NoTime_Error(TabData_Error):
+    "time window (or other time lookup) requested from a table without a time column"
+
+
+TabData_Formats = ["csv","atf","xvg","heka_csv","tdb","abf","heka_dat"]
+# format guessed from the file extension; .dat is taken for a HEKA csv export,
+# PatchMaster bundles (same extension) are not guessed, heka_dat has to be asked for by name
+TabData_Format_By_Extension = {"csv":"csv", "atf":"atf", "xvg":"xvg", "dat":"heka_csv", "tdb":"tdb", "abf":"abf"}
+# extension of each format in TabData_Formats, None if it is not told by extension
+TabData_Format_Extensions = [next((ext for ext, f in TabData_Format_By_Extension.items() if f == fmt), None)
+                             for fmt in TabData_Formats]
+
+def format_by_ext(fn):
+    "guess the format from file extension, None if unknown"
+    ext = fn[fn.rfind('.')+1:]
+    return TabData_Format_By_Extension.get(ext)
 
-TabData_Formats = ["csv","atf","xvg","heka_csv"]
-TabData_Format_Extensions = ["csv","atf","xvg","dat"]
+Bulk_Block_Rows = 65536 # number of text rows converted at once by the bulk parsers
+Write_Block_Rows = 8192 # number of rows formatted and written at once by the bulk writers
+Growth_Factor = 1.5     # storage grows by this factor when appending data
+Index_Every_Rows = 4096  # row spacing of checkpoints in sidecar row indices
+Index_Extension = "tdx"  # sidecar index file is named <data file>.tdx
+Cache_Dir_Env = "TABDATA_CACHE"  # env var overriding the parsed data cache location (default ~/.cache/tabdata)
+Cache_Max_Bytes = 4 << 30       # parsed data cache is pruned (least recently used first) to this size
+Cache_Hash_Bytes = 1 << 20      # this much of the head and the tail of a file goes into its cache key
+Memo_Max_Entries = 256          # in-process memo of parsed files (tabdata.load) keeps at most this many..
+Memo_Max_Bytes = 1 << 30        # ..and this much data
+Parallel_Range_Bytes = 16 << 20  # single file parallel reads split the data block into ranges of about this size
+Count_Block_Bytes = 4 << 20     # raw bytes are scanned in blocks of this size when counting lines
+Tdb_Chunk_Rows = 1 << 16        # tdb files store (and compress) columns in chunks of this many rows
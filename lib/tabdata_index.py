@@ -0,0 +1,182 @@
+#
+# Sidecar row index for random access into large text data files
+# Copyright (C) 2018  George Shapovalov <gshapovalov@gmail.com>
+#
+# Text formats cannot be seeked by row, so getting at a time window means parsing from the start.
+# A row index, built once by a streaming pass and kept next to the data file (<file>.tdx),
+# records the byte offset and time of every Index_Every_Rows'th data row. Windowed reads then
+# only parse the header, seek to the checkpoint just before the window and read from there.
+# The index records file size and mtime and is ignored once the data file changes.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os, types
+import numpy as np
+from .tabdata_common import *
+from .tabdata_io import _read_csv_header, _read_atf_header, _read_xvg_header, \
+                        _select_columns, _check_window, _read_block, _data_offset, _count_lines, _blank
+
+
+# per indexable format: header reader (returning Ncol, lineno of the 1st data line, ...),
+# field separator, exception class and whether rows need exact field counts (as the readers use them)
+Indexed_Formats = {
+    "csv":(lambda self, F: _read_csv_header(self, F, ","), ",",  FormatMismatch, True),
+    "atf":(_read_atf_header, "\t", ATF_Error, False),
+    "xvg":(_read_xvg_header, None, XVG_Error, False),
+    }
+
+
+class RowIndex:
+    """checkpoints into the data block of a text file:
+        rows    - data line numbers (counted from the 1st data line, 0 based)
+        offsets - byte offsets of these lines in the file
+        times   - values of the 1st field (time) on these lines
+        Nrows   - total N of data lines
+        sorted  - whether checkpoint times are non-decreasing (time lookups are only done then)
+    plus fmt, every (checkpoint spacing) and size/mtime of the indexed file.
+    """
+    def __init__(self, fmt, every, rows, offsets, times, Nrows, size, mtime):
+        self.fmt     = fmt
+        self.every   = int(every)
+        self.rows    = np.asarray(rows, dtype=np.int64)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.times   = np.asarray(times, dtype=np.float64)
+        self.Nrows   = int(Nrows)
+        self.size    = int(size)
+        self.mtime   = int(mtime)
+        self.sorted  = bool(np.all(np.diff(self.times) >= 0))
+
+    def __len__(self):
+        return len(self.rows)
+
+    def is_current(self, path):
+        "whether the index still matches the file at path (same size and modification time)"
+        st = os.stat(path)
+        return st.st_size == self.size and st.st_mtime_ns == self.mtime
+
+    def checkpoint(self, row_range = None, time_range = None):
+        """the last checkpoint at or before the start of the requested rows, returned as (row, offset),
+        None if the index is empty. Lines before the 1st checkpoint are blank, so it serves as the top.
+        A time window start is looked up only if times are sorted, otherwise reading starts at the top.
+        """
+        if len(self.rows) == 0:
+            return None
+        lowbound = (row_range is not None) or (time_range is not None and time_range[0] is not None)
+        k = len(self.rows) - 1 if lowbound else 0
+        if row_range is not None:
+            k = min(k, int(np.searchsorted(self.rows, row_range[0], "right")) - 1)
+        if time_range is not None and time_range[0] is not None:
+            if self.sorted:
+                # strictly before tlo, so that the 1st row at tlo (even a repeated time) is not skipped
+                k = min(k, int(np.searchsorted(self.times, time_range[0], "left")) - 1)
+            else:
+                k = 0
+        k = max(k, 0)
+        return int(self.rows[k]), int(self.offsets[k])
+
+    def save(self, path):
+        "write the index as an npz file (the name is used as is)"
+        with open(path, "wb") as F:
+            np.savez(F, fmt = self.fmt, every = self.every, rows = self.rows, offsets = self.offsets,
+                     times = self.times, Nrows = self.Nrows, size = self.size, mtime = self.mtime)
+
+
+def index_path(path):
+    "name of the sidecar index file of a data file"
+    return path + "." + Index_Extension
+
+def build_index(path, fmt, every = Index_Every_Rows, save = True):
+    """index the data file at path in a single streaming pass, return RowIndex.
+    Only the header and checkpoint lines are parsed, the rest is just scanned for line ends.
+    With save the index is also written to the sidecar file (see index_path).
+    """
+    if fmt not in Indexed_Formats:
+        raise FormatMismatch("cannot index format {}".format(fmt))
+    hdr_reader, sep, err, exact = Indexed_Formats[fmt]
+    st = os.stat(path)
+    with open(path) as F:
+        lineno = hdr_reader(types.SimpleNamespace(colID = [], headers = [], comments = []), F)[1]
+    bsep = sep.encode() if sep is not None else None
+    rows, offsets, times = [], [], []
+    with open(path, "rb") as F:
+        for i in range(lineno - 1):
+            F.readline()
+        offset = F.tell()
+        n, due = 0, 0
+        for line in F:
+            if n >= due and not _blank(line):
+                # checkpoint goes on the next non-blank line, so that its time is always there
+                try:
+                    times.append(float(line.split(bsep, 1)[0]))
+                except ValueError:
+                    raise err("malformed data row at line {}: {}".format(lineno + n, line.rstrip()))
+                rows.append(n)
+                offsets.append(offset)
+                due = n + every
+            offset += len(line)
+            n += 1
+    index = RowIndex(fmt, every, rows, offsets, times, n, st.st_size, st.st_mtime_ns)
+    if save:
+        index.save(index_path(path))
+    return index
+
+def count_rows(path, fmt):
+    """N of data rows of the file at path, without parsing them: only the header is read,
+    the rest is scanned for line ends in raw bytes (see _count_lines) and blank lines are left out.
+    """
+    if fmt not in Indexed_Formats:
+        raise FormatMismatch("cannot count rows of format {}".format(fmt))
+    with open(path) as F:
+        lineno = Indexed_Formats[fmt][0](types.SimpleNamespace(colID = [], headers = [], comments = []), F)[1]
+    Nlines, Nblank = _count_lines(path, _data_offset(path, lineno))
+    return Nlines - Nblank
+
+def load_index(path, fmt = None):
+    """load the sidecar index of the data file at path.
+    Returns None if there is none, or it is out of date or was built for another format.
+    """
+    try:
+        with np.load(index_path(path)) as npz:
+            index = RowIndex(str(npz["fmt"]), npz["every"], npz["rows"], npz["offsets"], npz["times"],
+                             npz["Nrows"], npz["size"], npz["mtime"])
+    except (OSError, KeyError, ValueError):
+        return None
+    if (fmt is not None and index.fmt != fmt) or not index.is_current(path):
+        return None
+    return index
+
+
+def read_indexed(self, F, fmt, index, usecols = None, row_range = None, time_range = None):
+    """mix-in reader: read rows of an indexed text file F (open in text mode), seeking via index.
+    The header is parsed as usual, then reading starts at the checkpoint just before the requested
+    row range/time window (see _iter_rows for their meaning) instead of the 1st data row.
+    Without any range this is just a plain read.
+    """
+    hdr_reader, sep, err, exact = Indexed_Formats[fmt]
+    _check_window(self, time_range)
+    Ncol, lineno = hdr_reader(self, F)[:2]
+    cols = _select_columns(self, Ncol, usecols)
+    start = index.checkpoint(row_range, time_range)
+    if start is None:
+        # no data rows at all
+        start = (0, F.tell())
+    skipped, offset = start
+    # offsets are in bytes, which text mode seek takes as is for stateless encodings (utf-8, latin-1)
+    F.seek(offset)
+    if row_range is not None:
+        Nfrom, Nto = row_range
+        row_range = (max(Nfrom - skipped, 0), Nto - skipped if Nto is not None else None)
+    _read_block(self, F, Ncol, sep, lineno + skipped, err, exact = exact, cols = cols,
+                row_range = row_range, time_range = time_range)
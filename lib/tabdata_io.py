@@ -31,79 +31,568 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-import csv
+import io, os, re, csv, copy, struct, fnmatch, datetime, itertools, warnings
+import numpy as np
 from .tabdata_common import *
+from .tabdata_time import UniformTime, uniform_time
+from .tabdata_stats import column_stats
 
 
-def read_csv(self, F, Separator = ','):
-    """read a basic csv file into self = Tabular_Data:
-        Accepts and autoassigns optional headers line,
-        all the following lines are expected to have (float) values.
-        All lines are supposed to have the same amount of entries (otherwise CSV_Error is raised).
-        Signal "no time column" condition when calling constructor.
-        sep  - separator to be used,
+# Why readers take text lines rather than raw bytes (mmap):
+# parsing straight from a mapped byte buffer was tried. On a 1M row, 60 MB atf
+# np.loadtxt over a list of str lines takes 0.86s, np.fromstring over the raw bytes 1.1-1.4s,
+# with another 0.75s to check per-line field counts in a vectorized way (which fromstring
+# cannot do, so it would silently misalign rows), and loadtxt over a byte/text stream 1.3-1.5s.
+# Splitting an mmap into lines is no faster than iterating a text file (0.25s vs 0.2s).
+# So the str per line is the cheapest input numpy's C parser has, and it stays.
+#
+# That parser is also where the throughput of a single process ends. For 65536 rows of a 4 column
+# atf: np.loadtxt over the lines 25 ms; whole-buffer tokenization is slower - np.fromstring of the
+# joined text 41 ms, np.array(text.split(), float) 60 ms - and still needs the per-line field count
+# check (15 ms). Reading a 500k row atf went from 1.24s (float() per field) to 0.54s, of which
+# loadtxt is 0.29s, getting the lines 0.1s and column stats 0.1s. That is about 2.3x, not 10x;
+# past this point only parsing in several processes (tabdata_parallel) or a binary format
+# (tabdata_binary, abf) helps.
+
+def _blank(line):
+    """is the text (or bytes) line free of data: empty, whitespace only, or the lone null char
+    seemingly added at the end of the file by some Windows editors
     """
-    reader = csv.reader(F, delimiter=Separator)
-    line1 = next(reader)
-    NCols = len(line1)
-    #print(line1, NCols)
-    # initialize base structure
+    return line.strip() in ("", "\x00", b"", b"\x00")
+
+def _load_rows(lines, Ncol, sep, exact, cols):
+    "the bulk part of _parse_rows: numpy's C parser over the whole list, ValueError if it does not fit"
+    Nout = Ncol if cols is None else len(cols)
+    if exact and cols is not None and set(map(str.count, lines, itertools.repeat(sep))) != {Ncol - 1} \
+       and any(line.count(sep) != Ncol - 1 for line in lines if not _blank(line)):
+        # loadtxt ignores extra fields when given usecols, so check the counts here
+        # (counted in one go first, blank lines are only told apart if there are other counts)
+        raise ValueError
+    with warnings.catch_warnings():
+        # all-blank block is not an error here
+        warnings.simplefilter("ignore", UserWarning)
+        if cols is None:
+            cols = None if exact else range(Ncol)
+        block = np.loadtxt(lines, delimiter=sep, usecols=cols, comments=None, ndmin=2)
+    if block.size == 0:
+        return np.empty((Nout, 0))
+    if block.shape[1] != Nout:
+        raise ValueError
+    return block.T
+
+def _parse_rows(lines, Ncol, sep, lineno, err, exact = False, cols = None):
+    """bulk convert a list of text data rows into a (Ncol, Nrows) float64 array.
+    Only the first Ncol fields of each row are used, blank lines are skipped.
+    Whole block goes through numpy's C parser (again without blank lines, if they were the trouble);
+    only if that fails the rows are redone one by one, to pinpoint the malformed one.
+        sep    - field separator, None means any whitespace
+        lineno - line number of lines[0] in the file, for error reporting
+        err    - exception class to raise on a malformed row
+        exact  - rows must have exactly Ncol fields (otherwise extra fields are ignored)
+        cols   - indices of the fields to keep (see _select_columns), None for all Ncol;
+                 the rest are not converted at all and the result has len(cols) rows
+    """
+    Nout = Ncol if cols is None else len(cols)
+    try:
+        return _load_rows(lines, Ncol, sep, exact, cols)
+    except ValueError:
+        pass
+    # loadtxt takes no blank lines with a separator given, nor the null char line some editors
+    # leave at the end, so give it one more go without these before falling back
+    rows = _data_lines(lines)
+    if rows is not lines:
+        try:
+            return _load_rows(rows, Ncol, sep, exact, cols)
+        except ValueError:
+            pass
+    if cols is None:
+        cols = range(Ncol)
+    # fallback - the old per-line loop
+    rows = []
+    for i, line in enumerate(lines):
+        if _blank(line):
+            continue
+        items = line.split(sep)
+        try:
+            if exact and len(items) != Ncol:
+                raise ValueError
+            rows.append([float(items[j]) for j in cols])
+        except (ValueError, IndexError):
+            raise err("malformed data row at line {}: {}".format(lineno + i, line.rstrip()))
+    return np.array(rows, dtype=np.float64).reshape(-1, Nout).T
+
+def _iter_rows(F, Ncol, sep, lineno, err, rows = Bulk_Block_Rows, exact = False, cols = None,
+               row_range = None, time_range = None):
+    """generator over the remaining data rows of F, yielding (Ncol, n) arrays of up to rows rows
+    (blank lines are dropped, so a block may come out shorter). Other params are as in _parse_rows, plus:
+        row_range  - (Nfrom, Nto): only data lines Nfrom <= n < Nto (counted from 0, Nto=None - to the end).
+                     Lines before Nfrom are skipped unparsed and reading stops at Nto.
+        time_range - (tlo, thi): rows from the 1st one with time (1st field) >= tlo up to, not including,
+                     the next one with time >= thi (same as TabData.time_window), either bound may be None.
+                     Before the window only the time field is converted, reading stops at its end.
+    """
+    if row_range is not None:
+        Nfrom, Nto = row_range
+        lineno += sum(1 for _ in itertools.islice(F, Nfrom))
+        if Nto is not None:
+            F = itertools.islice(F, max(Nto - Nfrom, 0))
+    tlo, thi = time_range if time_range is not None else (None, None)
+    started = tlo is None
+    while True:
+        lines = list(itertools.islice(F, rows))
+        if not lines:
+            return
+        Nlines = len(lines)
+        if tlo is None and thi is None:
+            yield _parse_rows(lines, Ncol, sep, lineno, err, exact, cols)
+            lineno += Nlines
+            continue
+        # find the window edges from the time field alone (blank lines dropped, so that rows match times)
+        lines = [line for line in lines if not _blank(line)]
+        t = _parse_rows(lines, 1, sep, lineno, err)[0]
+        i, j = 0, len(lines)
+        if not started:
+            after = t >= tlo
+            if not after.any():
+                lineno += Nlines
+                continue
+            i = int(np.argmax(after))
+            started = True
+        if thi is not None:
+            past = t[i:] >= thi
+            if past.any():
+                j = i + int(np.argmax(past))
+        yield _parse_rows(lines[i:j], Ncol, sep, lineno + i, err, exact, cols)
+        if j < len(lines):
+            return
+        lineno += Nlines
+
+def _check_window(self, time_range):
+    "a time window needs a time column to go by"
+    if time_range is not None and not self.has_time():
+        raise NoTime_Error("time window requested, but there is no time column")
+
+def _row_window(self, Npts, row_range, time_range):
+    """(Nfrom, Nto) rows to read of Npts, for the readers of binary formats that can seek to them.
+    Same narrowing as by _iter_rows: row range first, time window within it (self.time has to be
+    the whole time column by now).
+    """
+    _check_window(self, time_range)
+    Nfrom, Nto = 0, Npts
+    if row_range is not None:
+        Nfrom = min(row_range[0], Npts)
+        if row_range[1] is not None:
+            Nto = max(Nfrom, min(row_range[1], Npts))
+    if time_range is not None:
+        tlo, thi = time_range
+        Il = self.index_of_time(tlo) if tlo is not None else 0
+        Ih = max(Il, self.index_of_time(thi)) if thi is not None else Npts
+        Nfrom, Nto = max(Nfrom, Il), max(Nfrom, min(Nto, Ih))
+    return Nfrom, Nto
+
+def _file_path(F):
+    "the path of the regular file behind an open file F, None if there is none (pipes, stdin, StringIO..)"
+    path = getattr(F, "name", None)
+    if isinstance(path, str) and os.path.isfile(path):
+        return path
+    return None
+
+def _binary(F):
+    "the binary stream under F (text mode files are flushed and their buffer is used)"
+    if isinstance(F, io.TextIOBase):
+        F.flush()
+        return F.buffer
+    return F
+
+def _data_offset(path, lineno):
+    "byte offset of line lineno (1 based) of the file at path"
+    with open(path, "rb") as F:
+        for i in range(lineno - 1):
+            F.readline()
+        return F.tell()
+
+def _count_lines(path, begin = 0, end = None):
+    """count lines in bytes begin..end (None - to the end) of the file at path, begin being a line start.
+    Returns (N of lines, N of blank ones), an unterminated last line counts too. Raw bytes are scanned
+    in Count_Block_Bytes blocks, nothing is decoded. Only empty lines (or just CR) count as blank.
+    """
+    Nlines, Nblank = 0, 0
+    prev = b"\n"
+    with open(path, "rb") as F:
+        F.seek(begin)
+        while end is None or begin < end:
+            buf = F.read(Count_Block_Bytes if end is None else min(Count_Block_Bytes, end - begin))
+            if not buf:
+                break
+            Nlines += buf.count(b"\n")
+            # blank lines are LF LF or LF CR LF, which may start in the last 2 bytes of the previous block
+            # (only those ending in this one are counted, the rest were counted already)
+            a = np.frombuffer(prev + buf, dtype=np.uint8)
+            p = len(prev)
+            lf = a == 10
+            Nblank += int(np.count_nonzero((lf[:-1] & lf[1:])[p-1:]))
+            Nblank += int(np.count_nonzero((lf[:-2] & (a[1:-1] == 13) & lf[2:])[max(p-2, 0):]))
+            prev = (prev + buf)[-2:]
+            begin += len(buf)
+    if prev[-1:] != b"\n":
+        Nlines += 1
+    return Nlines, Nblank
+
+def _presize(F, lineno, row_range = None, time_range = None):
+    """capacity needed for the data rows of F from line lineno on: the N of non-blank lines,
+    within row_range if given (see _iter_rows). None if F is not a regular file, which cannot be counted,
+    or for a time window, whose size is not known before reading.
+    """
+    path = _file_path(F)
+    if path is None or time_range is not None:
+        return None
+    Nlines, Nblank = _count_lines(path, _data_offset(path, lineno))
+    Nrows = Nlines - Nblank
+    if row_range is not None:
+        Nfrom, Nto = row_range
+        Nrows = max(0, min(Nrows - Nfrom, Nrows if Nto is None else Nto - Nfrom))
+    return Nrows
+
+def _read_block(self, F, Ncol, sep, lineno, err, exact = False, cols = None,
+                row_range = None, time_range = None, nrows = None):
+    """read all remaining data rows of F in Bulk_Block_Rows sized blocks into self.time/self.data.
+    data ends up as one contiguous array, a uniform time is kept as UniformTime (no storage).
+    Column stats are gathered per block, while it is still hot in cache, so they come for free later.
+    nrows - expected N of rows (see _presize), blocks are then copied into place as they come
+            instead of being kept until the end, so peak memory is about the data plus one block.
+    Other params are as in _parse_rows and _iter_rows.
+    """
+    blocks = _iter_rows(F, Ncol, sep, lineno, err, exact = exact, cols = cols,
+                        row_range = row_range, time_range = time_range)
+    _set_blocks(self, blocks, Ncol if cols is None else len(cols), nrows)
+
+def _set_blocks(self, blocks, Ncol, nrows = None):
+    """stitch parsed (Ncol, n) blocks, in order, into self.time/self.data, see _read_block.
+    Ncol is the N of rows in blocks (time included), needed if there are no blocks at all.
+    With nrows data is filled into a buffer of that many rows (grown if it turns out short),
+    which backs the data (as the growth buffer of appends) in case there were fewer rows.
+    """
+    first = 1 if self.has_time() else 0
+    stats = column_stats(np.empty((Ncol - first, 0)))
+    if nrows is not None:
+        buf, tbuf = np.empty((Ncol - first, nrows)), np.empty(nrows if first else 0)
+        n = 0
+        for b in blocks:
+            m = b.shape[1]
+            if n + m > buf.shape[1]:
+                N = max(n + m, int(buf.shape[1]*Growth_Factor))
+                buf  = np.concatenate((buf[:, :n], np.empty((Ncol - first, N - n))), axis=1)
+                tbuf = np.concatenate((tbuf[:n], np.empty(N - n if first else 0)))
+            # 1st row holds time, the rest is data
+            if first:
+                tbuf[n:n+m] = b[0]
+            buf[:, n:n+m] = b[first:]
+            stats = stats.merge(column_stats(b[first:]))
+            n += m
+        if first:
+            self.time = uniform_time(tbuf[:n])
+        self._buf = buf
+        self.data = buf[:, :n]
+        self._set_stats(stats)
+        return
+    blocks = list(blocks)
+    if first:
+        # 1st row holds time, the rest is data
+        self.time = uniform_time(np.concatenate([b[0] for b in blocks]) if blocks else np.empty(0))
+    self.data = np.empty((Ncol - first, sum(b.shape[1] for b in blocks)))
+    for b in blocks:
+        stats = stats.merge(column_stats(b[first:]))
+    if blocks:
+        np.concatenate([b[first:] for b in blocks], axis=1, out=self.data)
+    self._set_stats(stats)
+
+class LazyColumns:
+    """data block of a lazily read table (see _read_lazy): raw text lines plus decoded columns.
+    A column is converted to floats on first access and kept; materialize() converts all
+    that are left in one pass and returns the usual (Nvars, Npts) array.
+        lines  - raw data lines (blank ones included, so that errors report right line numbers)
+        lineno - line number of lines[0] in the file
+        fields - field index of every data column
+    Ncol, sep, err and exact are as in _parse_rows.
+    """
+    def __init__(self, lines, lineno, Ncol, sep, err, exact, fields):
+        self.lines  = lines
+        self.lineno = lineno
+        self.Ncol   = Ncol
+        self.sep    = sep
+        self.err    = err
+        self.exact  = exact
+        self.fields = fields
+        self.rows   = _data_lines(lines)
+        self.shape  = (len(fields), len(self.rows))
+        self.columns = {}
+        self._uniform = None
+
+    def column(self, j):
+        "data column j (read-only, as it is copied into data once that gets materialized)"
+        col = self.columns.get(j)
+        if col is None:
+            col = self.field(self.fields[j])
+            col.flags.writeable = False
+            self.columns[j] = col
+        return col
+
+    def materialize(self):
+        "the whole (Nvars, Npts) data array, decoding columns not accessed yet all at once"
+        data = np.empty(self.shape)
+        todo = [j for j in range(len(self.fields)) if j not in self.columns]
+        if todo:
+            data[todo] = _parse_rows(self.lines, self.Ncol, self.sep, self.lineno, self.err, self.exact,
+                                     [self.fields[j] for j in todo])
+        for j, col in self.columns.items():
+            data[j] = col
+        return data
+
+    def field(self, k):
+        """convert field k of every row.
+        Only this field is cut out of each row (splitting from whichever end of the row is nearer),
+        which is much cheaper than tokenizing whole rows as loadtxt does. Anything unexpected
+        is redone by _parse_rows, to get its checks and error messages.
+        """
+        sep, rows = self.sep, self.rows
+        try:
+            if sep is None:
+                vals = [r.split(None, k + 1)[k] for r in rows]
+            elif k > self.Ncol//2 and self._all_uniform():
+                m = self.Ncol - k
+                vals = [r.rsplit(sep, m)[1] for r in rows]
+            else:
+                vals = [r.split(sep, k + 1)[k] for r in rows]
+            if self.exact and not self._all_uniform():
+                raise ValueError
+            return np.array(vals, dtype=np.float64)
+        except (ValueError, IndexError):
+            return _parse_rows(self.lines, self.Ncol, self.sep, self.lineno, self.err, self.exact, [k])[0]
+
+    def _all_uniform(self):
+        "whether all rows have exactly Ncol fields (checked once, separated formats only)"
+        if self._uniform is None:
+            n = self.Ncol - 1
+            self._uniform = all(r.count(self.sep) == n for r in self.rows)
+        return self._uniform
+
+def _data_lines(lines):
+    "lines without the blank ones (the list itself if there are none)"
+    rows = [line for line in lines if not _blank(line)]
+    return lines if len(rows) == len(lines) else rows
+
+def _read_lazy(self, F, Ncol, sep, lineno, err, exact = False, cols = None,
+               row_range = None, time_range = None):
+    """as _read_block, but only the time field is converted now: data is kept as raw lines in
+    a LazyColumns (self._lazy), whose columns get decoded on access (see TabData.column).
+    Malformed rows are thus only reported once a column touching them is decoded.
+    """
+    if row_range is not None:
+        Nfrom, Nto = row_range
+        lineno += sum(1 for _ in itertools.islice(F, Nfrom))
+        if Nto is not None:
+            F = itertools.islice(F, max(Nto - Nfrom, 0))
+    fields = list(cols if cols is not None else range(Ncol))
+    first = 1 if self.has_time() else 0
+    lazy = LazyColumns(list(F), lineno, Ncol, sep, err, exact, fields[first:])
+    if first:
+        time = lazy.field(0)
+        if time_range is not None:
+            # as time_window does, data is not there yet to go by
+            tlo, thi = time_range
+            self.time = time
+            Il = self.index_of_time(tlo) if tlo is not None else 0
+            Ih = max(Il, self.index_of_time(thi)) if thi is not None else len(time)
+            if (Il, Ih) != (0, len(time)):
+                # row indices skip blank lines, line indices do not
+                lines = lazy.lines
+                nonblank = [k for k, line in enumerate(lines) if not _blank(line)]
+                if Il < Ih:
+                    lines = lines[nonblank[Il]:nonblank[Ih-1]+1]
+                    lineno += nonblank[Il]
+                else:
+                    lines = []
+                lazy = LazyColumns(lines, lineno, Ncol, sep, err, exact, fields[first:])
+                time = time[Il:Ih]
+        self.time = uniform_time(time)
+    self.data = np.empty((lazy.shape[0], 0))
+    self._lazy = lazy
+
+def _set_block(self, block):
+    "distribute a (Ncol, N) parsed block into time (1st row, if we have time) and data, with its stats"
     if self.has_time():
-        self.data = [[] for i in range(NCols - 1)]
+        self.time = uniform_time(block[0])
+        self.data = block[1:]
     else:
-        self.data = [[] for i in range(NCols)]
-    #
-    # local function to pack data line (to avoid code duplication)
-    def line2data(items):
-        "distribute list of strings into time/data entries"
+        self.data = block
+    self._set_stats(column_stats(self.data))
+
+def _iter_chunks(self, blocks):
+    """wrap parsed blocks into TabData chunks.
+    Each chunk is a shallow copy of self (whose headers were already read),
+    so all chunks share the same colID/comments/headers lists.
+    """
+    empty = True
+    for block in blocks:
+        chunk = copy.copy(self)
+        _set_block(chunk, block)
+        empty = False
+        yield chunk
+    if empty:
+        # no data rows at all, still pass on the headers
+        yield copy.copy(self)
+
+def _selection(usecols):
+    "split usecols (see _select_columns) into a set of indices and a list of title patterns"
+    if isinstance(usecols, (int, str)):
+        usecols = [usecols]
+    return {u for u in usecols if not isinstance(u, str)}, [u for u in usecols if isinstance(u, str)]
+
+def _selected(idx, pats, j, name):
+    "is data column j, titled name, picked by the (idx, pats) selection"
+    name = name.strip('"')
+    return j in idx or any(fnmatch.fnmatchcase(name, p) for p in pats)
+
+def _check_selection(idx, pats, Nvars, names):
+    "raise TabData_Error if the selection asks for columns that are not there"
+    missing = sorted(j for j in idx if not 0 <= j < Nvars)
+    if missing:
+        raise TabData_Error("no data column(s) {} in {} columns".format(missing, Nvars))
+    for p in pats:
+        if not any(_selected((), [p], j, name) for j, name in enumerate(names)):
+            raise TabData_Error("no column title matches " + p)
+
+def _select_columns(self, Ncol, usecols):
+    """resolve usecols of readers into the fields to parse (time included) and trim colID to match.
+    usecols - None (all), a data column index or colID title pattern, or a list of these.
+              Indices count from the 1st data column (as nfirst in append_columns), patterns are
+              fnmatch style ("*R1", "ROI?") matched against titles with the quotes stripped.
+              Selected columns keep their file order.
+    Returns None when nothing is dropped, otherwise a list of field indices (for _parse_rows).
+    """
+    if usecols is None:
+        return None
+    ntime = 1 if self.has_time() else 0
+    Nvars = Ncol - ntime
+    names = self.colID[ntime:ntime+Nvars]
+    names = names + [""]*(Nvars - len(names))
+    idx, pats = _selection(usecols)
+    _check_selection(idx, pats, Nvars, names)
+    sel = [j for j in range(Nvars) if _selected(idx, pats, j, names[j])]
+    if self.colID != []:
+        self.colID = self.colID[:ntime] + [names[j] for j in sel]
+    return list(range(ntime)) + [ntime + j for j in sel]
+
+def _row_format(fmts, sep, lead = "", end = "\n"):
+    """make a str.format template for a single output row.
+    fmts - list of format specs, one per column (e.g. "" for plain str(), "e", ".6g")
+    """
+    sep = sep.replace("{","{{").replace("}","}}")
+    return lead + sep.join("{:" + f + "}" for f in fmts) + end
+
+def _column_formats(self, fmt, tfmt, dfmt):
+    """resolve the fmt param of writers into a list of per-column format specs.
+    fmt  - None (use defaults), a single spec for all data columns or
+           a list of specs for every column (time first, if present)
+    tfmt, dfmt - writer defaults for time and data columns
+    """
+    if fmt is None:
+        fmt = dfmt
+    if isinstance(fmt, str):
+        fmts = [fmt]*self.Nvars
         if self.has_time():
-            if len(items) != len(self.data)+1:
-                #print("mismatch of N entries:  N row =", len(self.data[0]), ", len=", len(items), ",  items = ", items)
-                raise FormatMismatch
-            self.time.append(float(items[0]))
-            for i in range(1,len(items)):
-                self.data[i-1].append(float(items[i]))
-        else:
-            if len(items) != len(self.data):
-                raise FormatMismatch
-            for i in range(len(items)):
-                self.data[i].append(float(items[i]))
-    #
+            fmts.insert(0, tfmt)
+        return fmts
+    if len(fmt) != self.Nvars + self.has_time():
+        raise DimensionMismatch
+    return list(fmt)
+
+def _write_rows(F, time, data, rowfmt, Nrows):
+    """bulk writer: formats Write_Block_Rows rows at once and writes them in a single chunk.
+    time   - 1-D array or None (no time column)
+    data   - 2-D (Ncol, N) array
+    rowfmt - single row template, as produced by _row_format
+    """
+    for i in range(0, Nrows, Write_Block_Rows):
+        blk = data[:, i:i+Write_Block_Rows]
+        if time is not None:
+            blk = np.vstack((time[i:i+Write_Block_Rows], blk))
+        # tolist() gives python floats, so "{}" formats them exactly as before (repr)
+        F.write((rowfmt * blk.shape[1]).format(*blk.T.ravel().tolist()))
+
+
+def _read_csv_header(self, F, Separator):
+    """read the 1st line of a csv file, assigning it to colID if it is a header.
+    Returns (Ncol, lineno, pending) - N of fields, line number of the 1st data line
+    and a list of already read data lines ([line1] if there is no header) to be parsed with the rest.
+    """
+    text1 = F.readline()
+    line1 = next(csv.reader([text1], delimiter=Separator))
+    NCols = len(line1)
+    #print(line1, NCols)
     # try to detect if 1st line contains a header or data
     try:
         ff = float(line1[0])
-        # no error -> no header, only data; pack the already read entries
-        line2data(line1)
+        # no error -> no header, only data; pass it on together with the rest
+        return NCols, 1, [text1]
     except ValueError:
         # we got a proper header, just use it directly
         self.colID = line1
-    #
-    # we are all set now, just run to the end reading data line by line
-    for line in reader:
-        if len(line) == 1 and line[0] == '\x00':
-            # ignore the null char at the end of the file, seemingly added by some Windows editors
-            break
-        line2data(line)
+        return NCols, 2, []
+
+def read_csv(self, F, Separator = ',', usecols = None, row_range = None, time_range = None,
+             presize = False, lazy = False):
+    """read a basic csv file into self = Tabular_Data:
+        Accepts and autoassigns optional headers line,
+        all the following lines are expected to have (float) values.
+        All lines are supposed to have the same amount of entries (otherwise FormatMismatch is raised).
+        Signal "no time column" condition when calling constructor.
+        sep  - separator to be used,
+        usecols - read only these data columns, see _select_columns (names need the header line)
+        row_range, time_range - read only these rows, see _iter_rows
+        presize - count rows first (fast, over raw bytes) and fill preallocated data (see _read_block)
+        lazy    - convert only time now, data columns on access (see _read_lazy and TabData.column)
+    """
+    _check_window(self, time_range)
+    NCols, lineno, pending = _read_csv_header(self, F, Separator)
+    cols = _select_columns(self, NCols, usecols)
+    if lazy:
+        _read_lazy(self, itertools.chain(pending, F), NCols, Separator, lineno, FormatMismatch,
+                   exact = True, cols = cols, row_range = row_range, time_range = time_range)
+        return
+    # we are all set now, just run to the end converting data in bulk
+    _read_block(self, itertools.chain(pending, F), NCols, Separator, lineno,
+                FormatMismatch, exact = True, cols = cols, row_range = row_range, time_range = time_range,
+                nrows = _presize(F, lineno, row_range, time_range) if presize else None)
 
-def write_csv(self, F, Separator = ','):
+def iter_csv(self, F, rows, Separator = ',', usecols = None, row_range = None, time_range = None):
+    "chunked version of read_csv: a generator of TabData blocks of up to rows rows"
+    _check_window(self, time_range)
+    NCols, lineno, pending = _read_csv_header(self, F, Separator)
+    cols = _select_columns(self, NCols, usecols)
+    return _iter_chunks(self, _iter_rows(itertools.chain(pending, F), NCols, Separator, lineno,
+                                         FormatMismatch, rows, exact = True, cols = cols,
+                                         row_range = row_range, time_range = time_range))
+
+def write_csv(self, F, Separator = ',', fmt = None, header = True):
     """write a basic csv file. Presence of headers or separate time should already be known..
         sep  - separator to be used,
+        fmt  - format spec(s) for the values, see _column_formats. Default is csv.writer-like repr
+        header - write the column titles line; pass False to append further chunks of the same table
     """
     writer = csv.writer(F, delimiter=Separator)
-    if self.colID != []:
+    if header and self.colID != []:
         # we have headers
         writer.writerow(self.colID)
-    for i in range(len(self.data[0])):
-        line = [] # we need to form a list to pass to a csv.writer
-        if hasattr(self,'time'):
-            line.append(self.time[i])
-        for j in range(len(self.data)):
-            line.append(self.data[j][i])
-        writer.writerow(line)
+    # numbers never need quoting, so the data block bypasses csv.writer (keeping its \r\n line ends)
+    rowfmt = _row_format(_column_formats(self, fmt, "", ""), Separator, end = "\r\n")
+    _write_rows(F, self.time if self.has_time() else None, self.data, rowfmt, self.Npts)
 
 
-def read_atf(self, F):
-    "read an ATF file, store headers as-is"
+def _read_atf_header(self, F):
+    """read the ATF header part (everything up to the data block) into self.
+    Returns (Ncol, lineno) - N of columns and line number of the 1st data line.
+    """
     if F.readline() != "ATF\t1.0\n": raise ATF_Error
     sNhdr, sNcol = F.readline().strip().split()
     Nhdr = int(sNhdr)
@@ -119,50 +608,366 @@ def read_atf(self, F):
             #print("removing quotes, newCol=" + newCol)
         self.colID.append(newCol)
     if len(self.colID) != Ncol: raise ATF_Error
-    # now just run until the end line by line..
-    # prepare the empty data columns (only data, no time here)
-    for i in range(Ncol-1):
-        self.data.append([])
-    for line in F:
-        items = line.split("\t")
-        self.time.append(float(items[0]))
-        for j in range(Ncol-1):
-            self.data[j].append(float(items[j+1]))
+    return Ncol, Nhdr + 4
+
+def read_atf(self, F, usecols = None, row_range = None, time_range = None,
+             presize = False, lazy = False):
+    """read an ATF file, store headers as-is
+    usecols - read only these data columns, see _select_columns
+    row_range, time_range - read only these rows, see _iter_rows
+    presize, lazy - see read_csv
+    """
+    Ncol, lineno = _read_atf_header(self, F)
+    cols = _select_columns(self, Ncol, usecols)
+    if lazy:
+        _read_lazy(self, F, Ncol, "\t", lineno, ATF_Error, cols = cols,
+                   row_range = row_range, time_range = time_range)
+        return
+    # now the data block, converted in bulk; 1st row holds time, the rest is data
+    _read_block(self, F, Ncol, "\t", lineno, ATF_Error, cols = cols,
+                row_range = row_range, time_range = time_range,
+                nrows = _presize(F, lineno, row_range, time_range) if presize else None)
+
+def iter_atf(self, F, rows, usecols = None, row_range = None, time_range = None):
+    "chunked version of read_atf: a generator of TabData blocks of up to rows rows"
+    Ncol, lineno = _read_atf_header(self, F)
+    cols = _select_columns(self, Ncol, usecols)
+    return _iter_chunks(self, _iter_rows(F, Ncol, "\t", lineno, ATF_Error, rows, cols = cols,
+                                         row_range = row_range, time_range = time_range))
 
-def write_atf(self, F):
-    "writes the collected data out in an atf format"
+def _write_atf_header(self, F):
+    "write the ATF header, everything up to the data block"
     # first the general headers
     F.write("ATF\t1.0\n")
     F.write("{}\t{}\n".format(len(self.headers), len(self.data)+1 ))
     for hdr in self.headers:
         F.write(hdr + "\n")
     # next form the column titles
-    for col in self.colID[:-1]:
+    colID = self.colID
+    if colID == []:
+        # ATF needs the titles line; a csv without header has no colIDs, so make up generic ones
+        colID = ["Time (ms)"] + ["col{}".format(j+1) for j in range(self.Nvars)]
+    for col in colID[:-1]:
         # readd quotes in titles
         F.write('"' + col + '"' + "\t")
-    F.write('"' + self.colID[-1] + '"' + "\n")
-    #
+    F.write('"' + colID[-1] + '"' + "\n")
+
+def write_atf(self, F, fmt = None, header = True):
+    """writes the collected data out in an atf format
+    fmt - format spec(s) for the values, see _column_formats. Default is plain time and "e" for data
+    header - write the ATF header; pass False to append further chunks of the same table
+    """
+    if header:
+        _write_atf_header(self, F)
     # now dump the data
-    for i in range(len(self.time)):
-        #F.write("{:01.4e}".format(self.time[i]))
-        F.write("{0}".format(self.time[i]))
-        for j in range(len(self.data)):
-            F.write("\t{0:e}".format(self.data[j][i]))
-        F.write("\n")
+    #rowfmt = _row_format(["01.4e"] + ["e"]*self.Nvars, "\t")
+    rowfmt = _row_format(_column_formats(self, fmt, "", "e"), "\t")
+    _write_rows(F, self.time, self.data, rowfmt, len(self.time))
 
 
-def read_xvg_gmx(self, F):
-    """reader for an xvg (xmgrace) file format produced by gromacs
+# Axon Binary Format (ABF2), as written by pClamp 10+.
+# A file is made of 512 byte blocks. Block 0 holds the file info and a table of sections
+# (block index, bytes per entry, N of entries); used here are the protocol (operation mode,
+# sampling interval, ADC range), ADC (per channel scaling, name and units), strings and data.
+# Data are int16 (or float32) samples with channels interleaved, sweeps of episodic files
+# follow one another. Tables get time in ms and, for every sweep, a column per channel.
+Abf_Block = 512
+Abf_Episodic, Abf_Gap_Free = 5, 3 # nOperationMode values
 
-    XVG format is rather complex, may have multiple sequential entries. And there already
-    exists an interpreter {ref}, so no point to reimplement entire thing.
-    This is designed to specifically read files produced by gromacs analysis (rmsd, values output, etc..)
+def _abf_struct(fields):
+    "(Struct, fields) of a packed little endian record given as a list of (name, struct format)"
+    return struct.Struct("<" + "".join(f for n, f in fields)), fields
+
+_abf_file_info = _abf_struct([
+    ("uFileSignature","4s"), ("uFileVersionNumber","4s"), ("uFileInfoSize","I"), ("uActualEpisodes","I"),
+    ("uFileStartDate","I"), ("uFileStartTimeMS","I"), ("uStopwatchTime","I"), ("nFileType","h"),
+    ("nDataFormat","h"), ("nSimultaneousScan","h"), ("nCRCEnable","h"), ("uFileCRC","I"),
+    ("FileGUID","16s"), ("uCreatorVersion","I"), ("uCreatorNameIndex","I"), ("uModifierVersion","I"),
+    ("uModifierNameIndex","I"), ("uProtocolPathIndex","I")])
+# section table follows the file info, in this order
+_abf_sections = ["Protocol", "ADC", "DAC", "Epoch", "ADCPerDAC", "EpochPerDAC", "UserList", "StatsRegion",
+                 "Math", "Strings", "Data", "Tag", "Scope", "Delta", "VoiceTag", "SynchArray",
+                 "Annotation", "Stats"]
+_abf_section = struct.Struct("<IIq") # block index, bytes per entry, N of entries
+_abf_protocol = _abf_struct([
+    ("nOperationMode","h"), ("fADCSequenceInterval","f"), ("bEnableFileCompression","b"), ("sUnused1","3s"),
+    ("uFileCompressionRatio","I"), ("fSynchTimeUnit","f"), ("fSecondsPerRun","f"),
+    ("lNumSamplesPerEpisode","i"), ("lPreTriggerSamples","i"), ("lEpisodesPerRun","i"),
+    ("lRunsPerTrial","i"), ("lNumberOfTrials","i"), ("nAveragingMode","h"), ("nUndoRunCount","h"),
+    ("nFirstEpisodeInRun","h"), ("fTriggerThreshold","f"), ("nTriggerSource","h"), ("nTriggerAction","h"),
+    ("nTriggerPolarity","h"), ("fScopeOutputInterval","f"), ("fEpisodeStartToStart","f"),
+    ("fRunStartToStart","f"), ("lAverageCount","i"), ("fTrialStartToStart","f"),
+    ("nAutoTriggerStrategy","h"), ("fFirstRunDelayS","f"), ("nChannelStatsStrategy","h"),
+    ("lSamplesPerTrace","i"), ("lStartDisplayNum","i"), ("lFinishDisplayNum","i"), ("nShowPNRawData","h"),
+    ("fStatisticsPeriod","f"), ("lStatisticsMeasurements","i"), ("nStatisticsSaveStrategy","h"),
+    ("fADCRange","f"), ("fDACRange","f"), ("lADCResolution","i"), ("lDACResolution","i")])
+_abf_adc = _abf_struct([
+    ("nADCNum","h"), ("nTelegraphEnable","h"), ("nTelegraphInstrument","h"), ("fTelegraphAdditGain","f"),
+    ("fTelegraphFilter","f"), ("fTelegraphMembraneCap","f"), ("nTelegraphMode","h"),
+    ("fTelegraphAccessResistance","f"), ("nADCPtoLChannelMap","h"), ("nADCSamplingSeq","h"),
+    ("fADCProgrammableGain","f"), ("fADCDisplayAmplification","f"), ("fADCDisplayOffset","f"),
+    ("fInstrumentScaleFactor","f"), ("fInstrumentOffset","f"), ("fSignalGain","f"), ("fSignalOffset","f"),
+    ("fSignalLowpassFilter","f"), ("fSignalHighpassFilter","f"), ("nLowpassFilterType","b"),
+    ("nHighpassFilterType","b"), ("fPostProcessLowpassFilter","f"), ("nPostProcessLowpassFilterType","b"),
+    ("bEnabledDuringPN","b"), ("nStatsChannelPolarity","h"), ("lADCChannelNameIndex","i"),
+    ("lADCUnitsIndex","i")])
+_abf_adc_entry = 128 # bytes per ADC section entry
+# strings section: signature, version, N of strings, max length, total bytes, unused; then 0-terminated strings
+_abf_strings = struct.Struct("<4sIIIi24s")
+
+def _abf_unpack(rec, buf, offset = 0):
+    S, fields = rec
+    return dict(zip((n for n, f in fields), S.unpack_from(buf, offset)))
+
+def _abf_pack(rec, size, **values):
+    "pack a record padded to size bytes, fields not given are 0"
+    S, fields = rec
+    return S.pack(*(values.get(n, b"" if f.endswith("s") else 0) for n, f in fields)).ljust(size, b"\0")
+
+def _abf_read(B, block, size):
+    B.seek(block*Abf_Block)
+    buf = B.read(size)
+    if len(buf) != size:
+        raise ABF_Error("truncated abf file")
+    return buf
+
+def _abf_strings_list(buf):
+    """indexed strings of the strings section (index 0 - empty string).
+    pClamp puts a few strings before the indexed ones into the section header area, so strings are
+    counted from the last double 0 (end of the header), as other ABF readers do.
+    """
+    buf = buf[buf.rfind(b"\0\0"):]
+    return [s.decode("latin-1").replace("\xb5", "u").strip() for s in buf.split(b"\0")[1:]]
+
+def _abf_header(B):
+    """parse the ABF2 header of a binary file B, returns a dict with the params of the layout:
+    mode, Nch, Nsweeps, Npts (per sweep and channel), dt (ms), dtype, scale, offset (per channel),
+    names, units, data (byte offset of data)
+    """
+    buf = _abf_read(B, 0, Abf_Block)
+    info = _abf_unpack(_abf_file_info, buf)
+    if info["uFileSignature"] != b"ABF2":
+        raise ABF_Error("not an ABF2 file" + (" (ABF1 is not supported)" if info["uFileSignature"] == b"ABF " else ""))
+    sec = {name:_abf_section.unpack_from(buf, _abf_file_info[0].size + k*_abf_section.size)
+           for k, name in enumerate(_abf_sections)}
+    prot = _abf_unpack(_abf_protocol, _abf_read(B, sec["Protocol"][0], _abf_protocol[0].size))
+    block, size, Nstr = sec["Strings"]
+    strings = _abf_strings_list(_abf_read(B, block, size*Nstr)) if Nstr else []
+    def string(i):
+        return strings[i] if 0 <= i < len(strings) else ""
+    block, size, Nch = sec["ADC"]
+    if Nch == 0:
+        raise ABF_Error("no ADC channels")
+    adcbuf = _abf_read(B, block, size*Nch)
+    scale, offset, names, units = [], [], [], []
+    for k in range(Nch):
+        adc = _abf_unpack(_abf_adc, adcbuf, k*size)
+        gain = adc["fInstrumentScaleFactor"]*adc["fSignalGain"]*adc["fADCProgrammableGain"]
+        if adc["nTelegraphEnable"]:
+            gain *= adc["fTelegraphAdditGain"]
+        scale.append(prot["fADCRange"]/(prot["lADCResolution"]*gain))
+        offset.append(adc["fInstrumentOffset"] - adc["fSignalOffset"])
+        names.append(string(adc["lADCChannelNameIndex"]) or "IN {}".format(adc["nADCNum"]))
+        units.append(string(adc["lADCUnitsIndex"]))
+    block, size, N = sec["Data"]
+    if size not in (2, 4):
+        raise ABF_Error("unsupported sample size {}".format(size))
+    mode = prot["nOperationMode"]
+    if mode == Abf_Episodic:
+        Nsweeps = info["uActualEpisodes"]
+        Npts = prot["lNumSamplesPerEpisode"]//Nch
+    elif mode == Abf_Gap_Free:
+        Nsweeps, Npts = 1, N//Nch
+    else:
+        raise ABF_Error("unsupported operation mode {} (only episodic and gap free are)".format(mode))
+    if Nsweeps*Npts*Nch > N:
+        raise ABF_Error("data section is shorter than the sweeps")
+    if info["nDataFormat"] == 1:
+        dtype = np.dtype("<f4")
+        scale, offset = [1.0]*Nch, [0.0]*Nch
+    else:
+        dtype = np.dtype("<i2")
+    return {"mode":mode, "Nch":Nch, "Nsweeps":Nsweeps, "Npts":Npts, "dt":prot["fADCSequenceInterval"]/1000,
+            "dtype":dtype, "scale":scale, "offset":offset, "names":names, "units":units,
+            "data":block*Abf_Block}
+
+def _abf_titles(names, units):
+    "column titles of one sweep: just the units for single channel files (as in episodic ATF), name (units) otherwise"
+    if len(names) == 1:
+        return [units[0]]
+    return ["{} ({})".format(n, u) for n, u in zip(names, units)]
+
+def read_abf(self, F, usecols = None, row_range = None, time_range = None):
+    """read an Axon ABF2 file (episodic or gap free, int16 or float32 samples), F is open in binary
+    (or text) mode and has to be seekable. Columns are sweeps, each with all channels in turn
+    (see _abf_titles), time is in ms from the sweep start.
+    usecols - read only these columns (sweep/channel), see _select_columns
+    row_range, time_range - read only these samples of every sweep
+    Only the samples needed are read and scaled.
+    """
+    B = _binary(F)
+    hdr = _abf_header(B)
+    Nch, Npts = hdr["Nch"], hdr["Npts"]
+    self.headers.append('"AcquisitionMode={}"'.format(
+        "Episodic Stimulation" if hdr["mode"] == Abf_Episodic else "Gap Free"))
+    self.colID = ["Time (ms)"] + _abf_titles(hdr["names"], hdr["units"])*hdr["Nsweeps"]
+    self.time = UniformTime(0, hdr["dt"], Npts, decimals = 6)
+    cols = _select_columns(self, 1 + Nch*hdr["Nsweeps"], usecols)
+    cols = range(Nch*hdr["Nsweeps"]) if cols is None else [c - 1 for c in cols[1:]]
+    Nfrom, Nto = _row_window(self, Npts, row_range, time_range)
+    n, size = Nto - Nfrom, hdr["dtype"].itemsize
+    data = np.empty((len(cols), n))
+    raw = np.empty((n, Nch), dtype = hdr["dtype"])
+    sweep = None
+    for j, c in enumerate(cols):
+        if c//Nch != sweep:
+            sweep = c//Nch
+            B.seek(hdr["data"] + ((sweep*Npts + Nfrom)*Nch)*size)
+            if B.readinto(memoryview(raw).cast("B")) != raw.nbytes:
+                raise ABF_Error("truncated abf file")
+        ch = c % Nch
+        np.multiply(raw[:, ch], hdr["scale"][ch], out = data[j])
+        data[j] += hdr["offset"][ch]
+    self.time = self.time[Nfrom:Nto]
+    self.data = data
+
+def _abf_channel(title):
+    "(name, units) from a column title, see _abf_titles"
+    title = title.strip('"')
+    if title.endswith(")") and " (" in title:
+        name, units = title[:-1].rsplit(" (", 1)
+        return name, units
+    return "", title
+
+def _abf_scaling(values):
+    """(fInstrumentScaleFactor, fInstrumentOffset) to store values as int16 with the ADC range of +-10V:
+    the full int16 range spans the values. The step is recomputed from the float32 fields,
+    as readers will use them.
+    """
+    lo, hi = (float(np.min(values)), float(np.max(values))) if values.size else (0.0, 0.0)
+    offset = np.float32((lo + hi)/2)
+    half = max(hi - float(offset), float(offset) - lo)
+    factor = np.float32(10.0*32767/(32768*half) if half > 0 else 1.0)
+    return float(factor), float(offset)
+
+def write_abf(self, F, channels = None, mode = None, dtype = "int16", header = True):
+    """write the table as an Axon ABF2 file (F open in binary or text mode).
+    channels - N of channels (columns per sweep); by default all columns for gap free data, otherwise
+               as many as there are different titles before the 1st repeat (1 for "pA" "pA" ..)
+    mode     - "episodic" or "gapfree"; by default taken from the AcquisitionMode header (as read
+               from ATF/ABF files), episodic if there is none
+    dtype    - "int16": samples are scaled to the full int16 range per channel (as acquired ones are),
+               so values are rounded to 1/65535 of the channel span; "float32" keeps them as is
+    Time has to be uniform; its start is not stored, ABF sweeps always start at 0.
+    header is only accepted for the sake of convert: abf files are written whole.
     """
+    if not header:
+        raise ABF_Error("abf cannot be appended to")
+    if dtype not in ("int16", "float32"):
+        raise ABF_Error("unknown sample type {}".format(dtype))
+    if mode is None:
+        mode = "gapfree" if any("AcquisitionMode=Gap Free" in h for h in self.headers) else "episodic"
+    if mode not in ("episodic", "gapfree"):
+        raise ABF_Error("unknown mode {}".format(mode))
+    if not self.has_time() or self.Npts < 2:
+        raise ABF_Error("abf needs a time column with at least 2 points")
+    dt = self.time.dt if isinstance(self.time, UniformTime) else float(self.time[1] - self.time[0])
+    if not isinstance(self.time, UniformTime) and \
+       not np.allclose(np.diff(np.asarray(self.time)), dt, rtol = 1e-6, atol = 0):
+        raise ABF_Error("abf needs uniformly sampled data")
+    titles = self.colID[1:1+self.Nvars] if self.colID else []
+    titles = titles + ["col{}".format(j+1) for j in range(len(titles), self.Nvars)]
+    if channels is None:
+        channels = self.Nvars if mode == "gapfree" else \
+                   next((k for k in range(1, self.Nvars) if titles[k] == titles[0]), self.Nvars)
+    if mode == "gapfree" and channels != self.Nvars:
+        raise ABF_Error("gap free data should have a column per channel")
+    if channels < 1 or self.Nvars % channels:
+        raise DimensionMismatch("{} columns do not make sweeps of {} channels".format(self.Nvars, channels))
+    Nsweeps, Npts = self.Nvars//channels, self.Npts
+    chans = [_abf_channel(t) for t in titles[:channels]]
+    # strings: creator, then channel names and units
+    strings = ["tabdata"]
+    def index(s):
+        if not s:
+            return 0
+        if s not in strings:
+            strings.append(s)
+        return strings.index(s) + 1
+    adcs = []
+    samples = np.empty((Nsweeps, Npts, channels), dtype = "<i2" if dtype == "int16" else "<f4")
+    for ch, (name, units) in enumerate(chans):
+        values = self.data[ch::channels]
+        factor, offset = _abf_scaling(values) if dtype == "int16" else (1.0, 0.0)
+        if dtype == "int16":
+            if np.isnan(values).any():
+                raise ABF_Error("NaN values cannot be stored as int16")
+            step = 10.0/(32768*np.float32(factor))
+            samples[:, :, ch] = np.clip(np.rint((values - offset)/step), -32768, 32767)
+        else:
+            samples[:, :, ch] = values
+        adcs.append(_abf_pack(_abf_adc, _abf_adc_entry, nADCNum = ch, nADCPtoLChannelMap = ch,
+                    nADCSamplingSeq = ch, fADCProgrammableGain = 1, fADCDisplayAmplification = 1,
+                    fInstrumentScaleFactor = factor, fInstrumentOffset = offset, fSignalGain = 1,
+                    fSignalLowpassFilter = 1e5, fSignalHighpassFilter = 0, fTelegraphAdditGain = 1,
+                    lADCChannelNameIndex = index(name or "IN {}".format(ch)), lADCUnitsIndex = index(units)))
+    strbuf = b"".join(s.encode("latin-1", "replace") + b"\0" for s in strings)
+    strbuf = _abf_strings.pack(b"SSCH", 1, len(strings), max(map(len, strings)), len(strbuf), b"") + strbuf
+    synch = np.array([[k*Npts*channels, Npts*channels] for k in range(Nsweeps)], dtype = "<i4") \
+            if mode == "episodic" else np.empty((0, 2), dtype = "<i4")
+    # lay out the sections: protocol, ADC, strings, synch array, data, a whole number of blocks each
+    blocks = lambda n: -(-n//Abf_Block)
+    sections = {}
+    layout = [("Protocol", Abf_Block, 1), ("ADC", _abf_adc_entry, channels), ("Strings", len(strbuf), 1),
+              ("SynchArray", 8, len(synch)), ("Data", samples.itemsize, samples.size)]
+    block = 1
+    for name, size, N in layout:
+        sections[name] = (block if N else 0, size, N)
+        block += blocks(size*N)
+    now = datetime.datetime.now()
+    info = _abf_pack(_abf_file_info, _abf_file_info[0].size, uFileSignature = b"ABF2",
+                     uFileVersionNumber = bytes((0, 0, 6, 2)), uFileInfoSize = Abf_Block,
+                     uActualEpisodes = Nsweeps if mode == "episodic" else 1,
+                     uFileStartDate = now.year*10000 + now.month*100 + now.day,
+                     uFileStartTimeMS = ((now.hour*60 + now.minute)*60 + now.second)*1000 + now.microsecond//1000,
+                     nFileType = 1, nDataFormat = 0 if dtype == "int16" else 1, nSimultaneousScan = 1,
+                     uCreatorNameIndex = 1)
+    info += b"".join(_abf_section.pack(*sections.get(name, (0, 0, 0))) for name in _abf_sections)
+    prot = _abf_pack(_abf_protocol, Abf_Block,
+                     nOperationMode = Abf_Episodic if mode == "episodic" else Abf_Gap_Free,
+                     fADCSequenceInterval = dt*1000, fSynchTimeUnit = 0, fSecondsPerRun = Npts*dt/1000,
+                     lNumSamplesPerEpisode = Npts*channels, lEpisodesPerRun = Nsweeps, lRunsPerTrial = 1,
+                     lNumberOfTrials = 1, fEpisodeStartToStart = Npts*dt/1000, lSamplesPerTrace = Npts,
+                     lFinishDisplayNum = Npts, fADCRange = 10, fDACRange = 10,
+                     lADCResolution = 32768, lDACResolution = 32768)
+    B = _binary(F)
+    def write(buf):
+        B.write(buf)
+        pad = -len(buf) % Abf_Block
+        if pad:
+            B.write(bytes(pad))
+    write(info)
+    write(prot)
+    write(b"".join(adcs))
+    write(strbuf)
+    if len(synch):
+        write(synch.tobytes())
+    write(samples.reshape(-1).view(np.uint8))
+    B.flush()
+
+
+def _read_xvg_header(self, F):
+    """read the comments/directives part of a gromacs xvg into self.
+    The 1st data line has to be read to know N of columns, so it is returned for further processing:
+    returns (Ncol, lineno, pending) as _read_csv_header does.
+    """
+    nlines = 1
     # first we have a bunch of comments. Each line starts with '#'
     line = F.readline().strip()
     while line[0] == '#':
         self.comments.append(line[1:])
         line = F.readline().strip()
+        nlines += 1
     # next it typically has a bunch of grace directives
     if line[0] != '@':
         # we are supposed to have a few headers here, at least column names..
@@ -176,12 +981,14 @@ def read_xvg_gmx(self, F):
     self.headers.append(line[1:])
     #
     line = F.readline().strip()
+    nlines += 1
     if line[0:18] == "@    xaxis  label ":
         # we have x and yaxis labels, record these
         self.colID.append('"' + line.split('"')[-2] + '"')
         line = F.readline().strip().split('"')
         self.colID.append('"' + line[-2] + '"')
         line = F.readline().strip()
+        nlines += 2
     else:
         # for compatibility with other formats, we add empty colIDs, even if nothing was found
         self.colID.append("")
@@ -191,111 +998,543 @@ def read_xvg_gmx(self, F):
     while line[0] == '@':
         self.headers.append(line[1:])
         line = F.readline().strip()
+        nlines += 1
     # now this should be the start of data block
     items = line.split()
     try:
-        self.time.append(float(items[0]))
-        for item in items[1:]:
-            self.data.append([float(item)])
+        [float(item) for item in items]
     except ValueError:
         raise XVG_Error
     # now, after processing the 1st data line, we know N of columns,
     # so we can finish populating the colIDs
-    for j in range(2,len(self.data)):
+    for j in range(2,len(items)-1):
         self.colID.append(self.colID[1])
+    return len(items), nlines, [line]
+
+def read_xvg_gmx(self, F, usecols = None, row_range = None, time_range = None,
+                 presize = False, lazy = False, sets = None):
+    """reader for an xvg (xmgrace) file format produced by gromacs
+
+    XVG format is rather complex, may have multiple sequential entries. And there already
+    exists an interpreter {ref}, so no point to reimplement entire thing.
+    This is designed to specifically read files produced by gromacs analysis (rmsd, values output, etc..)
+    usecols - read only these data columns, see _select_columns
+    row_range, time_range - read only these rows, see _iter_rows
+    presize, lazy - see read_csv
+    sets    - for files of several "&" separated sets: read these sets (see iter_xvg_sets, "*" - all)
+              into a single table, a set after another column-wise. Sets have to share their time then.
+              None - the file is a single data block.
+    """
+    if sets is not None:
+        _read_xvg_sets(self, F, sets, usecols, row_range, time_range)
+        return
+    Ncol, lineno, pending = _read_xvg_header(self, F)
+    cols = _select_columns(self, Ncol, usecols)
+    if lazy:
+        _read_lazy(self, itertools.chain(pending, F), Ncol, None, lineno, XVG_Error, cols = cols,
+                   row_range = row_range, time_range = time_range)
+        return
     # now we are all set with headers and data struct, process the rest of it
+    _read_block(self, itertools.chain(pending, F), Ncol, None, lineno, XVG_Error, cols = cols,
+                row_range = row_range, time_range = time_range,
+                nrows = _presize(F, lineno, row_range, time_range) if presize else None)
+
+def iter_xvg_gmx(self, F, rows, usecols = None, row_range = None, time_range = None):
+    "chunked version of read_xvg_gmx: a generator of TabData blocks of up to rows rows"
+    Ncol, lineno, pending = _read_xvg_header(self, F)
+    cols = _select_columns(self, Ncol, usecols)
+    return _iter_chunks(self, _iter_rows(itertools.chain(pending, F), Ncol, None, lineno, XVG_Error,
+                                         rows, cols = cols, row_range = row_range, time_range = time_range))
+
+
+# Multi-set xvg files (grace projects, gromacs tools run over several groups or terms):
+# a common prelude of comments and @-directives, then sets, each optionally led by its own
+# @target/@type directives and ended by a "&" line. Sets are read one by one, as they come.
+
+_xvg_label  = re.compile(r'@\s*([xy])axis\s+label\s+"(.*)"')
+_xvg_legend = re.compile(r'@\s*s(\d+)\s+legend\s+"(.*)"')
+_xvg_target = re.compile(r'@\s*target\s+G\d+\.S(\d+)', re.IGNORECASE)
+
+def _read_xvg_prelude(self, F):
+    """read comments and directives before the 1st set of a multi-set xvg into self.comments/headers.
+    Axis labels and set legends are picked up wherever they are in there.
+    Returns (labels, legends, lineno, line): [x, y] labels (quoted, "" if missing), {set N: legend},
+    the 1st line of the 1st set (its data or @target, "" if there is none) and its line number.
+    """
+    labels, legends = ["", ""], {}
+    lineno = 0
     for line in F:
-        items = line.split()
-        self.time.append(float(items[0]))
-        for j in range(len(self.data)):
-            self.data[j].append(float(items[j+1]))
+        lineno += 1
+        s = line.strip()
+        if s == "":
+            continue
+        if s[0] == '#':
+            self.comments.append(s[1:])
+            continue
+        if s[0] != '@' or _xvg_target.match(s):
+            return labels, legends, lineno, line
+        self.headers.append(s[1:])
+        m = _xvg_label.match(s)
+        if m:
+            labels["xy".index(m.group(1))] = '"' + m.group(2) + '"'
+        m = _xvg_legend.match(s)
+        if m:
+            legends[int(m.group(1))] = m.group(2)
+    return labels, legends, lineno + 1, ""
+
+def _xvg_rows(F, line, stop):
+    """data lines of a set, from line on, up to its end: a "&" or the @-line of the next set.
+    That line ("" at the end of file) goes to stop[0], stop[1] counts the data lines.
+    """
+    while line and line.lstrip()[:1] not in ("&", "@"):
+        stop[1] += 1
+        yield line
+        line = next(F, "")
+    stop[0] = line
+
+def _xvg_sets(F, lineno, line):
+    """generator over the sets of a multi-set xvg, starting at line (see _read_xvg_prelude).
+    Yields (n, directives, lineno, rows) for every set: its number (from @target, otherwise the one
+    after the previous set), its own @-lines, the line number of its 1st data line and an iterator
+    over its data lines. Lines not taken from rows are skipped (unparsed) once the next set is asked for.
+    """
+    F = iter(F)
+    n = 0
+    while line:
+        directives = []
+        while line and (_blank(line) or line.lstrip()[0] == '@'):
+            if not _blank(line):
+                s = line.strip()
+                m = _xvg_target.match(s)
+                if m:
+                    n = int(m.group(1))
+                directives.append(s[1:])
+            line = next(F, "")
+            lineno += 1
+        if not line:
+            return
+        stop = [None, 0]
+        rows = _xvg_rows(F, line, stop)
+        yield n, directives, lineno, rows
+        for _ in rows:
+            pass
+        lineno += stop[1]
+        line = stop[0]
+        if line.lstrip()[:1] == '&':
+            line = next(F, "")
+            lineno += 1
+        n += 1
+
+def iter_xvg_sets(self, F, sets = None, usecols = None, row_range = None, time_range = None):
+    """generator over the sets of a multi-set xvg, each coming as a TabData as soon as it is read.
+    sets - read only these sets: set numbers (as in "@target G0.S3", from 0) and/or fnmatch patterns
+           of set legends, as usecols in _select_columns; None - all of them.
+           Data lines of other sets are skipped unparsed, and reading stops after the last one
+           of the numbered sets if no patterns are given.
+    usecols, row_range, time_range - as in read_xvg_gmx, applied to every set.
+    Comments and headers of the prelude are shared by all sets, set's own directives are added to its
+    headers. colID is the x axis label plus the legend of a set (or the y axis label) for its data columns.
+    """
+    _check_window(self, time_range)
+    idx, pats = _selection(sets) if sets is not None else (None, None)
+    labels, legends, lineno, line = _read_xvg_prelude(self, F)
+    seen = []
+    # numbered sets still to come, None - there is no telling where the last wanted set is
+    todo = set(idx) if idx is not None and not pats else None
+    for n, directives, lineno, rows in _xvg_sets(F, lineno, line):
+        if todo == set():
+            break
+        legend = legends.get(n, "")
+        if idx is not None:
+            if not _selected(idx, pats, n, legend):
+                continue
+            seen.append((n, legend))
+        # N of columns comes with the 1st data line
+        pending = []
+        for line in rows:
+            pending.append(line)
+            if not _blank(line):
+                break
+        Ncol = len(pending[-1].split()) if pending else 2
+        s = copy.copy(self)
+        s.headers = self.headers + directives
+        s.colID = [labels[0]] + ['"' + legend + '"' if legend else labels[1]]*(Ncol - 1)
+        cols = _select_columns(s, Ncol, usecols)
+        _set_blocks(s, _iter_rows(itertools.chain(pending, rows), Ncol, None, lineno, XVG_Error,
+                                  cols = cols, row_range = row_range, time_range = time_range),
+                    Ncol if cols is None else len(cols))
+        yield s
+        if todo is not None:
+            todo.discard(n)
+            if not todo:
+                break
+    if idx is not None:
+        missing = sorted(idx - {n for n, legend in seen})
+        if missing:
+            raise TabData_Error("no set(s) {} in the file".format(missing))
+        for p in pats:
+            if not any(_selected((), [p], n, legend) for n, legend in seen):
+                raise TabData_Error("no set legend matches " + p)
 
+def _read_xvg_sets(self, F, sets, usecols, row_range, time_range):
+    "read_xvg_gmx of several sets: selected sets of F go side by side into self"
+    tables = list(iter_xvg_sets(self, F, sets, usecols, row_range, time_range))
+    if not tables:
+        raise XVG_Error("no sets selected")
+    first = tables[0]
+    for t in tables[1:]:
+        if not np.array_equal(np.asarray(t.time), np.asarray(first.time)):
+            raise XVG_Error("sets differ in time, read them separately (iter_xvg_sets)")
+    self.time = first.time
+    self.colID = list(first.colID)
+    for t in tables[1:]:
+        self.colID += t.colID[1:]
+    self.data = np.concatenate([t.data for t in tables])
+    stats = first.stats()
+    for t in tables[1:]:
+        stats = stats.stack(t.stats())
+    self._set_stats(stats)
 
-def write_xvg_gmx(self, F):
-    "write out data in xvg format (gromacs output like)"
+
+def write_xvg_gmx(self, F, fmt = None, header = True):
+    """write out data in xvg format (gromacs output like)
+    fmt - format spec(s) for the values, see _column_formats. Default is plain str() for all
+    header - write the comments and directives; pass False to append further chunks of the same table
+    """
     # no special header;
-    # comments on top
-    for line in self.comments:
-        F.write('#' + line + '\n')
-    # headers - xmgrace scripting
-    for line in self.headers:
-        F.write('@' + line + '\n')
+    if header:
+        # comments on top
+        for line in self.comments:
+            F.write('#' + line + '\n')
+        # headers - xmgrace scripting
+        for line in self.headers:
+            F.write('@' + line + '\n')
     # no column title line; if anything there, it is set via headers scripting
     # finally the data itself
-    for i in range(len(self.data[0])):
-        # xvgs seem to start with whitespace, try to preserve this in case this matters somewhere
-        # actually this happens automatically if every write is preceded by whitespace
-        # (which is likely why that format is this way)
-        if self.has_time():
-            F.write("  {}".format(self.time[i]))
-        for j in range(len(self.data)):
-            F.write("  {}".format(self.data[j][i]))
-        F.write("\n")
-
-
-def read_HEKA_csv(self, F):
-    "reads the csv file exported by HEKA and constructs the proper table"
-    reader = csv.reader(F)
-    # 1st line is different, do special processing before the cycle
-    line1 = next(reader)
-    if len(line1) != 1 or line1[0][:6] != "Series":
+    # xvgs seem to start with whitespace, try to preserve this in case this matters somewhere
+    # actually this happens automatically if every write is preceded by whitespace
+    # (which is likely why that format is this way)
+    rowfmt = _row_format(_column_formats(self, fmt, "", ""), "  ", lead = "  ")
+    _write_rows(F, self.time if self.has_time() else None, self.data, rowfmt, self.Npts)
+
+
+# HEKA csv export: a "Series_.." line, then sweeps, each a "Sweep_.." line, column titles
+# ("Index", "Time[s]", "Imon[A]", "Vmon[V]" ..) and data rows, ended by a blank line.
+# Values are converted by convention (as in read_HEKA_dat): time to ms, current to pA, voltage to mV.
+def _HEKA_csv_channels(titles, channels = None):
+    """parse column titles of HEKA csv sweeps, returns (Ncol, time field, [(field, title, factor)..])
+    for the channels selected by number (from 1) or name ("Imon"), None - all.
+    Column titles are quoted as before; single channel ones are just the units ("pA").
+    """
+    tfield, chans = None, []
+    for k, title in enumerate(titles[1:], 1):
+        name, unit = title[:-1].split("[", 1) if title.endswith("]") and "[" in title else (title, "")
+        if name.startswith("Time"):
+            # multichannel exports may repeat time for every channel, the 1st one is used
+            if tfield is None:
+                tfield = k
+            continue
+        chans.append((k, name.strip(), *_heka_units.get(unit, (unit, 1.0))))
+    if tfield is None:
+        raise HEKA_CSV_Error("no time column")
+    if channels is not None:
+        sel = []
+        for c in channels:
+            match = [ch for n, ch in enumerate(chans) if (n == c - 1 if isinstance(c, int) else ch[1] == c)]
+            if not match:
+                raise HEKA_CSV_Error("no channel {}".format(c))
+            sel.append(match[0])
+        chans = sel
+    return len(titles), tfield, [(k, '"{}"'.format(u) if len(chans) == 1 else '"{} ({})"'.format(name, u), factor)
+                                 for k, name, u, factor in chans]
+
+def _HEKA_csv_sweeps(F, channels = None):
+    """generator over the sweeps of a HEKA csv export F: (label, chans, lineno, lines) for each, with
+    lines - data rows (text) of the sweep, lineno - line number of the 1st one, chans - see _HEKA_csv_channels.
+    All sweeps have to have the same columns and length as the 1st one, this is checked as rows are read.
+    """
+    line = F.readline()
+    if line[:6] != "Series" or "," in line:
         raise HEKA_CSV_Error
-    #
-    last_row_empty = True # to signal the start of new episode
-    firstSweep = True
-    #iSweep = -1 # N of the episode
-    i, NSmpl  = 0, 0 # cycle index and total samples in single episode
-    # max i and NSmpl need to match at the end of each episode!
-    #
-    for row in reader:
-        #main cycle
-        #print("main cycle, ep ", len(self.data)-1,";  row = ", row)
-        if len(row) == 0: #empty line - end of an episode"
-            if last_row_empty:
-                # two empty lines in a row signal the end of file
-                break
-            last_row_empty = True
-            firstSweep = False
-            if len(self.data[-1]) != len(self.time):
-                # sweep length mismatch!
-                # This will generally create problems for Axon later,
-                # so we raise an exception in this version
-                #print(self.time)
-                #print(self.data)
-                raise HEKA_CSV_Error
-        elif last_row_empty:  # start of new episode
-            if row[0][:5] == "Sweep":
-                # beginning of a new episode/sweep, reset/increment indeces
-                self.data.append([])
-                #iSweep = len(self.data) - 1
-                last_row_empty = False
-                # and skip the next line which should contain column headers
-                # ATTN!!
-                # now, for quickness we just assume time (s) and current (A)
-                # add some checks/conversions to produce more generic code if/when needed!!
-                if next(reader)[0] != "Index": raise HEKA_CSV_Error
-            else:
-                # unexpected mismatch of format
-                raise HEKA_CSV_Error
+    lineno, titles, chans, Npts = 1, None, None, None
+    while True:
+        line = F.readline()
+        lineno += 1
+        if _blank(line):
+            # a blank line after the one ending a sweep (or the end of file) ends the series
+            return
+        if line[:5] != "Sweep":
+            raise HEKA_CSV_Error("unexpected line {}: {}".format(lineno, line.rstrip()))
+        label = line.split(",")[0].strip()
+        row = [t.strip().strip('"').strip() for t in F.readline().split(",")]
+        lineno += 1
+        if row[0] != "Index":
+            raise HEKA_CSV_Error("no column titles at line {}".format(lineno))
+        if chans is None:
+            titles, chans = row, _HEKA_csv_channels(row, channels)
+        elif row != titles:
+            raise HEKA_CSV_Error("columns of {} differ from the 1st sweep".format(label))
+        # rows up to a blank line; no more than one past the 1st sweep length, to catch longer ones right away
+        lines = list(itertools.islice(itertools.takewhile(str.strip, iter(F.readline, "")),
+                                      None if Npts is None else Npts + 1))
+        if Npts is None:
+            Npts = len(lines)
+        elif len(lines) > Npts:
+            # sweep length mismatch will generally create problems for Axon later
+            raise HEKA_CSV_Error("{} is longer than the 1st sweep (line {})".format(label, lineno + len(lines)))
+        elif len(lines) != Npts:
+            raise HEKA_CSV_Error("{} is shorter than the 1st sweep".format(label))
+        yield label, chans, lineno + 1, lines
+        lineno += len(lines) + 1
+
+def _HEKA_csv_blocks(self, F, channels, row_range, time_range, pick):
+    """generator behind the HEKA csv readers: yields (label, titles, block) for every sweep, block holding
+    the converted values of the channels chosen by pick(N of sweep, channel titles) -> positions, rows in the window.
+    Time is taken from the 1st sweep (all sweeps start at 0), which also decides the rows of the window
+    (see _row_window); self.time is set once it is read.
+    Only the selected fields of the rows in the window are converted, a sweep at a time.
+    """
+    window = None
+    for n, (label, (Ncol, tfield, chans), lineno, lines) in enumerate(_HEKA_csv_sweeps(F, channels)):
+        if window is None:
+            t = _parse_rows(lines, Ncol, ",", lineno, HEKA_CSV_Error, exact = True, cols = [tfield])[0]
+            # round to prevent representation error, mks resolution is realistically the smallest
+            self.time = np.array([round(v*1000, 3) for v in t], dtype = np.float64)
+            window = Nfrom, Nto = _row_window(self, len(t), row_range, time_range)
+            self.time = uniform_time(self.time[Nfrom:Nto])
+        sel = [chans[j] for j in pick(n, [title for k, title, factor in chans])]
+        if sel:
+            block = _parse_rows(lines[Nfrom:Nto], Ncol, ",", lineno + Nfrom, HEKA_CSV_Error, exact = True,
+                                cols = [k for k, title, factor in sel])
+            block *= np.array([factor for k, title, factor in sel])[:, None]
         else:
-            # the regular iteration, bulk of data
-            if len(row) != 3:
-                # data lines should have 3 entries, otherwise its a multi-channel file
-                print("multiple channel file!")
-                raise HEKA_CSV_Error
-            #
-            if firstSweep:
-                # time is in milliseconds by convention
-                self.time.append(round(float(row[1])*1000,3)) # round to prevent representation error, mks resolution is realistically the smallest
-            # current is in pA by convention
-            self.data[-1].append(float(row[2])*1e12)
-    #
-    # done with data, need to recreate headers and column names
+            block = np.empty((0, Nto - Nfrom))
+        yield label, [title for k, title, factor in sel], block
+
+def read_HEKA_csv(self, F, usecols = None, row_range = None, time_range = None, channels = None):
+    """reads the csv file exported by HEKA and constructs the proper table.
+    Columns are sweeps, each with a column per channel (as in read_abf), see _HEKA_csv_channels for titles.
+    channels - read only these channels, by number (from 1) or name ("Imon"), None - all
+    usecols  - read only these columns (sweep/channel), see _select_columns
+    row_range, time_range - keep only these rows (samples), as in _iter_rows
+    Sweeps are converted in bulk as they are read, only the selected columns and rows.
+    """
+    idx, pats = _selection(usecols) if usecols is not None else (None, None)
+    names = []
+    def pick(n, titles):
+        names.extend(titles)
+        return [j for j, title in enumerate(titles)
+                if idx is None or _selected(idx, pats, len(names) - len(titles) + j, title)]
+    colID, blocks = [], []
+    for label, titles, block in _HEKA_csv_blocks(self, F, channels, row_range, time_range, pick):
+        colID += titles
+        blocks.append(block)
+    if idx is not None:
+        _check_selection(idx, pats, len(names), names)
+    if not blocks:
+        self.time = np.empty(0)
+    self.data = np.concatenate(blocks) if blocks else np.empty((0, 0))
     # just use most common ATF values here for Episodic data..
     self.headers.append('"AcquisitionMode=Episodic Stimulation"')
     self.colID.append('"Time (ms)"')
-    for i in range(len(self.data)):
-        self.colID.append('"pA"')
-    # should be all done now
+    self.colID += colID
+
+def iter_HEKA_csv(self, F, usecols = None, row_range = None, time_range = None, channels = None):
+    """generator over the sweeps of a HEKA csv export, each coming as a TabData with a column per channel
+    as soon as it is read (so that sweeps can be written out or reduced on the fly).
+    Params are as in read_HEKA_csv, usecols selects among channels of a sweep here.
+    Headers and colID are shared by all sweeps, the label of a sweep ("Sweep_1_2_3") is in its comments.
+    """
+    idx, pats = _selection(usecols) if usecols is not None else (None, None)
+    def pick(n, titles):
+        if n == 0 and idx is not None:
+            _check_selection(idx, pats, len(titles), titles)
+        return [j for j, title in enumerate(titles) if idx is None or _selected(idx, pats, j, title)]
+    for label, titles, block in _HEKA_csv_blocks(self, F, channels, row_range, time_range, pick):
+        if not self.colID:
+            self.headers.append('"AcquisitionMode=Episodic Stimulation"')
+            self.colID += ['"Time (ms)"'] + titles
+        sweep = copy.copy(self)
+        sweep.comments = [label]
+        sweep.data = block
+        yield sweep
+
+
+# HEKA PatchMaster bundle (.dat).
+# The bundle header lists the files packed into it: .pul holds the tree of what was recorded
+# (root / group / series / sweep / trace), .pgf the stimuli, .dat the raw samples, etc.
+# A tree starts with a magic, the N of levels and the record size of every level, then come
+# records depth first, each followed by its N of children. Trace records point into the raw data
+# (file offset, N of points, sample format, scaler), so sweeps are read straight into columns.
+# Only the fields used here are unpacked, at their offsets in the PatchMaster v2x records
+# (the record sizes are taken from the tree, so newer/longer records are fine).
+_heka_fields = { # tree level: [(name, offset, format)]
+    1: [("label", 4, "32s")],
+    2: [("label", 4, "32s"), ("comment", 36, "80s")],
+    3: [("label", 4, "32s")],
+    4: [("label", 4, "32s"), ("data", 40, "i"), ("points", 44, "i"), ("format", 70, "b"),
+        ("scaler", 72, "d"), ("zero", 88, "d"), ("yunit", 96, "8s"), ("dx", 104, "d"), ("x0", 112, "d"),
+        ("xunit", 120, "8s"), ("interleave", 292, "i"), ("skip", 296, "i")]
+    }
+_heka_formats = ["i2", "i4", "f4", "f8"] # TrDataFormat
+# units are converted as by read_HEKA_csv: time to ms, current to pA, voltage to mV
+_heka_units = {"s":("ms", 1e3), "A":("pA", 1e12), "V":("mV", 1e3)}
+
+def _heka_bundle(B):
+    """parse the bundle header of a PatchMaster file B (binary), returns the (byte order, items) with
+    items mapping extensions (".pul", ".dat", ..) to (offset, size); a non-bundled .dat file gives no items
+    """
+    B.seek(0)
+    buf = B.read(256)
+    sig = buf[:4]
+    if sig in (b"DAT1", b"DATA"):
+        return "<", {}
+    if sig != b"DAT2" or len(buf) < 256:
+        raise HEKA_DAT_Error("not a PatchMaster data file")
+    e = "<" if buf[52] else ">"
+    items = {}
+    for k in range(min(struct.unpack_from(e + "i", buf, 48)[0], 12)):
+        start, size, ext = struct.unpack_from(e + "ii8s", buf, 64 + 16*k)
+        items[ext.split(b"\0")[0].decode("latin-1")] = (start, size)
+    return e, items
+
+def _heka_str(b):
+    return b.split(b"\0")[0].decode("latin-1").strip()
+
+def _heka_tree(buf):
+    """parse a PatchMaster tree (.pul contents) into nested dicts: fields of _heka_fields for the level,
+    plus "children" (list of nodes) and "level"
+    """
+    if buf[:4] == b"eerT":
+        e = "<"
+    elif buf[:4] == b"Tree":
+        e = ">"
+    else:
+        raise HEKA_DAT_Error("bad tree signature")
+    Nlevels = struct.unpack_from(e + "i", buf, 4)[0]
+    sizes = struct.unpack_from(e + "{}i".format(Nlevels), buf, 8)
+    pos = 8 + 4*Nlevels
+    def node(level):
+        nonlocal pos
+        rec = {"level":level}
+        for name, offset, fmt in _heka_fields.get(level, []):
+            if offset + struct.calcsize(fmt) > sizes[level]:
+                rec[name] = 0 # older, shorter records
+                continue
+            val = struct.unpack_from(e + fmt, buf, pos + offset)[0]
+            rec[name] = _heka_str(val) if fmt.endswith("s") else val
+        pos += sizes[level]
+        N = struct.unpack_from(e + "i", buf, pos)[0]
+        pos += 4
+        rec["children"] = [node(level + 1) for k in range(N)] if level + 1 < Nlevels else []
+        return rec
+    try:
+        return node(0)
+    except struct.error:
+        raise HEKA_DAT_Error("truncated tree")
+
+def HEKA_dat_tree(F):
+    """the pulsed tree (groups / series / sweeps / traces) of the PatchMaster file F (binary or text mode, seekable),
+    see _heka_tree for the nodes. A non-bundled file needs the .pul file next to it.
+    """
+    B = _binary(F)
+    e, items = _heka_bundle(B)
+    if ".pul" in items:
+        start, size = items[".pul"]
+        B.seek(start)
+        return _heka_tree(B.read(size))
+    path = _file_path(F)
+    if path is None:
+        raise HEKA_DAT_Error("no .pul in the bundle")
+    with open(os.path.splitext(path)[0] + ".pul", "rb") as P:
+        return _heka_tree(P.read())
 
+def list_HEKA_dat(F):
+    "list the series in PatchMaster file F: (path, label, N of sweeps, trace labels of the 1st sweep) for each"
+    out = []
+    for g, group in enumerate(HEKA_dat_tree(F)["children"]):
+        for s, series in enumerate(group["children"]):
+            sweeps = series["children"]
+            traces = [tr["label"] for tr in sweeps[0]["children"]] if sweeps else []
+            out.append(("{}.{}".format(g+1, s+1), series["label"], len(sweeps), traces))
+    return out
 
+def _heka_samples(B, tr, e, Nfrom, Nto):
+    "raw samples Nfrom..Nto of trace tr, as an array of its format"
+    dtype = np.dtype(e + _heka_formats[tr["format"]])
+    if tr["interleave"] > 0 and tr["skip"] > tr["interleave"]:
+        # stored in pieces of interleave bytes, skip bytes apart
+        need, parts, pos = Nto*dtype.itemsize, [], tr["data"]
+        while need > 0:
+            B.seek(pos)
+            parts.append(B.read(min(tr["interleave"], need)))
+            need -= len(parts[-1])
+            pos += tr["skip"]
+        buf = b"".join(parts)[Nfrom*dtype.itemsize:]
+    else:
+        B.seek(tr["data"] + Nfrom*dtype.itemsize)
+        buf = B.read((Nto - Nfrom)*dtype.itemsize)
+    if len(buf) != (Nto - Nfrom)*dtype.itemsize:
+        raise HEKA_DAT_Error("truncated data")
+    return np.frombuffer(buf, dtype = dtype)
+
+def read_HEKA_dat(self, F, series = "1.1", sweeps = None, traces = None, usecols = None,
+                  row_range = None, time_range = None):
+    """read a series straight from a PatchMaster data file (.dat bundle, F open in binary or text mode, seekable).
+    series - tree path of the series, "group.series" (or a (group, series) tuple), counting from 1
+             as PatchMaster does; see list_HEKA_dat
+    sweeps - sweep numbers to read (from 1), None - all
+    traces - traces (channels) of every sweep to read, by number (from 1) or label ("Imon"), None - all
+    Columns are sweeps with a column per trace, as in read_abf; values are in pA/mV, time in ms.
+    usecols, row_range, time_range - as in other readers; only the samples needed are read.
+    Sweeps of different length are NaN-padded with strict_rect off, an error otherwise.
+    """
+    B = _binary(F)
+    e, items = _heka_bundle(B)
+    root = HEKA_dat_tree(F)
+    g, s = (int(k) for k in (series.split(".") if isinstance(series, str) else series))
+    try:
+        ser = root["children"][g-1]["children"][s-1]
+        swps = ser["children"] if sweeps is None else [ser["children"][k-1] for k in sweeps]
+    except IndexError:
+        raise HEKA_DAT_Error("no series {}.{} or sweeps {} in it".format(g, s, sweeps))
+    columns = []
+    for sw in swps:
+        trs = sw["children"]
+        if traces is None and len(trs) != len(swps[0]["children"]):
+            raise HEKA_DAT_Error("sweeps differ in traces, select them")
+        for t in (range(1, len(trs) + 1) if traces is None else traces):
+            sel = [k for k, tr in enumerate(trs) if (k == t - 1 if isinstance(t, int) else tr["label"] == t)]
+            if not sel:
+                raise HEKA_DAT_Error("no trace {} in sweep {}".format(t, sw["label"]))
+            columns.append(trs[sel[0]])
+    if not columns:
+        raise HEKA_DAT_Error("nothing to read")
+    first = columns[0]
+    Ntr = len(columns)//len(swps)
+    Npts = max(tr["points"] for tr in columns)
+    if any(tr["points"] != Npts for tr in columns) and self.strict_rect:
+        raise HEKA_DAT_Error("sweeps differ in length")
+    if any(tr["dx"] != first["dx"] for tr in columns):
+        raise HEKA_DAT_Error("traces differ in sampling")
+    tunit, tfactor = _heka_units.get(first["xunit"], (first["xunit"], 1))
+    units = [_heka_units.get(tr["yunit"], (tr["yunit"], 1)) for tr in columns]
+    # quoted as those of read_HEKA_csv, so that both exports of a recording convert alike
+    titles = ['"{}"'.format(u) for u, f in units[:Ntr]] if Ntr == 1 else \
+             ['"{} ({})"'.format(tr["label"], u) for tr, (u, f) in zip(columns[:Ntr], units[:Ntr])]
+    self.headers.append('"AcquisitionMode=Episodic Stimulation"')
+    if ser["label"]:
+        self.comments.append("series {}.{} {}".format(g, s, ser["label"]))
+    self.colID = ['"Time ({})"'.format(tunit)] + titles*len(swps)
+    self.time = UniformTime(first["x0"]*tfactor, first["dx"]*tfactor, Npts, decimals = 6)
+    cols = _select_columns(self, 1 + len(columns), usecols)
+    cols = range(len(columns)) if cols is None else [c - 1 for c in cols[1:]]
+    Nfrom, Nto = _row_window(self, Npts, row_range, time_range)
+    data = np.full((len(cols), Nto - Nfrom), np.nan)
+    for j, c in enumerate(cols):
+        tr, factor = columns[c], units[c][1]
+        a, b = min(Nfrom, tr["points"]), min(Nto, tr["points"])
+        raw = _heka_samples(B, tr, e, a, b)
+        data[j, :b-a] = raw*(tr["scaler"]*factor) + tr["zero"]*factor
+    self.time = self.time[Nfrom:Nto]
+    self.data = data
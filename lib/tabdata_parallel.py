@@ -0,0 +1,145 @@
+#
+# Parallel parsing of a single large text data file
+# Copyright (C) 2018  George Shapovalov <gshapovalov@gmail.com>
+#
+# Parsing is CPU bound and a single long recording is otherwise parsed on one core.
+# Here the header is parsed once by the calling process, then the data block is split into
+# byte ranges of about Parallel_Range_Bytes, each ending at a line end, which are parsed
+# in a pool of worker processes. Parsed column blocks come back (pickled as raw buffers)
+# and are stitched in file order. Only a few ranges are in flight at a time, so streaming
+# (iter_parallel) keeps memory bounded.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os, io, collections, multiprocessing
+import numpy as np
+from .tabdata_common import *
+from .tabdata_io import _select_columns, _iter_rows, _set_blocks, _iter_chunks, _file_path, \
+                        _data_offset, _count_lines
+from .tabdata_index import Indexed_Formats
+
+
+def _pool_context():
+    """start processes by fork where possible: workers then need not import the calling script,
+    which matters as utils run their code at the top level, without a __main__ guard
+    """
+    if "fork" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("fork")
+    return None
+
+def split_ranges(path, start, range_bytes = Parallel_Range_Bytes):
+    """split bytes from start to the end of the file at path into (begin, end) ranges
+    of about range_bytes, each (but the last one) ending right after a newline.
+    Only the bytes around the splits are read.
+    """
+    size = os.path.getsize(path)
+    bounds = [start]
+    with open(path, "rb") as F:
+        pos = start + range_bytes
+        while pos < size:
+            # a range may end right at pos, if the byte before it is a newline
+            F.seek(pos - 1)
+            F.readline()
+            if F.tell() >= size:
+                break
+            bounds.append(F.tell())
+            pos = F.tell() + range_bytes
+    bounds.append(size)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+def _parse_range(path, begin, end, fmt, Ncol, cols, lineno):
+    """pool worker: parse data lines in bytes begin..end of the file at path into a single block,
+    as the readers of fmt do. lineno (line number of the 1st line of the range) is only used in errors.
+    """
+    hdr_reader, sep, err, exact = Indexed_Formats[fmt]
+    with open(path, "rb") as F:
+        F.seek(begin)
+        text = F.read(end - begin).decode()
+    # universal newlines, as in the text mode files the readers normally get
+    blocks = list(_iter_rows(io.StringIO(text, newline = None), Ncol, sep, lineno, err,
+                             exact = exact, cols = cols))
+    if not blocks:
+        return np.empty((Ncol if cols is None else len(cols), 0))
+    return blocks[0] if len(blocks) == 1 else np.concatenate(blocks, axis = 1)
+
+def _iter_ranges(path, fmt, Ncol, cols, lineno, workers):
+    """generator over parsed blocks of the data block of the file at path (starting at line lineno),
+    in file order. Ranges are parsed in a pool of workers (N of CPUs if None) with at most 2 per worker
+    in flight; with one worker or a single range everything is parsed right here.
+    """
+    err = Indexed_Formats[fmt][2]
+    start = _data_offset(path, lineno)
+    ranges = split_ranges(path, start)
+
+    def failed(begin, end):
+        # line numbers of a range are only known once lines before it are counted,
+        # so do it now and redo the range for a proper error message
+        _parse_range(path, begin, end, fmt, Ncol, cols, lineno + _count_lines(path, start, begin)[0])
+
+    if workers == 1 or len(ranges) < 2:
+        for begin, end in ranges:
+            try:
+                yield _parse_range(path, begin, end, fmt, Ncol, cols, lineno)
+            except err:
+                failed(begin, end)
+                raise
+        return
+    workers = workers or os.cpu_count()
+    todo = iter(ranges)
+    # a plain Pool rather than ProcessPoolExecutor, as submitting many small tasks one by one can
+    # deadlock the latter (seen with python 3.11); load_many uses a Pool too, for the same reason
+    with (_pool_context() or multiprocessing).Pool(workers) as pool:
+        pending = collections.deque()
+        def submit():
+            r = next(todo, None)
+            if r is not None:
+                pending.append((r, pool.apply_async(_parse_range, (path, *r, fmt, Ncol, cols, lineno))))
+        for i in range(2*workers):
+            submit()
+        while pending:
+            (begin, end), res = pending.popleft()
+            try:
+                block = res.get()
+            except err:
+                failed(begin, end)
+                raise
+            submit()
+            yield block
+
+def _parallel_setup(self, F, fmt, usecols):
+    "parse the header of F, return the (path, Ncol, cols, lineno) to pass to _iter_ranges"
+    if fmt not in Indexed_Formats:
+        raise FormatMismatch("cannot read format {} in parallel".format(fmt))
+    path = _file_path(F)
+    if path is None:
+        raise TabData_Error("parallel reads need a regular file")
+    Ncol, lineno = Indexed_Formats[fmt][0](self, F)[:2]
+    return path, Ncol, _select_columns(self, Ncol, usecols), lineno
+
+def read_parallel(self, F, fmt, workers = None, usecols = None):
+    """mix-in reader: read the text file F (open in text mode, must be a regular file) of format fmt,
+    parsing its data block in a pool of workers processes (N of CPUs if None). Header and colID
+    are parsed here, usecols is as in the other readers. The result is the same as of a plain read.
+    """
+    path, Ncol, cols, lineno = _parallel_setup(self, F, fmt, usecols)
+    _set_blocks(self, _iter_ranges(path, fmt, Ncol, cols, lineno, workers),
+                Ncol if cols is None else len(cols))
+
+def iter_parallel(self, F, fmt, workers = None, usecols = None):
+    """mix-in: chunked counterpart of read_parallel, chunks (one per byte range, about
+    Parallel_Range_Bytes of text each) come in file order as those of the chunked readers.
+    """
+    path, Ncol, cols, lineno = _parallel_setup(self, F, fmt, usecols)
+    return _iter_chunks(self, _iter_ranges(path, fmt, Ncol, cols, lineno, workers))
@@ -0,0 +1,91 @@
+#
+# Per-column summary statistics for TabData
+# Copyright (C) 2018  George Shapovalov <gshapovalov@gmail.com>
+#
+# ColumnStats holds a few running sums per data column (min, max, sum, sum of squares, counts),
+# which is all that is needed for extremes, means and variances. Stats of row blocks merge
+# and stats of column blocks stack, so they can be kept up to date while reading or appending
+# instead of rescanning all of the data on every query.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import numpy as np
+
+
+class ColumnStats:
+    """Summary of every data column, each field is a 1-D array of length Nvars:
+        min, max   - extremes, ignoring NaN (NaN if a column has no values)
+        sum, sumsq - sum and sum of squares of non-NaN values
+        count      - number of non-NaN values
+        nans       - number of NaN values
+    """
+    def __init__(self, min, max, sum, sumsq, count, nans):
+        self.min   = min
+        self.max   = max
+        self.sum   = sum
+        self.sumsq = sumsq
+        self.count = count
+        self.nans  = nans
+
+    def __len__(self):
+        return len(self.sum)
+
+    def merge(self, other):
+        "stats of both row blocks together (same columns, other's rows following ours)"
+        return ColumnStats(np.fmin(self.min, other.min), np.fmax(self.max, other.max),
+                           self.sum + other.sum, self.sumsq + other.sumsq,
+                           self.count + other.count, self.nans + other.nans)
+
+    def stack(self, other):
+        "stats of both column blocks side by side (other's columns following ours)"
+        return ColumnStats(*(np.concatenate((a, b)) for a, b in zip(self._fields(), other._fields())))
+
+    def _fields(self):
+        return self.min, self.max, self.sum, self.sumsq, self.count, self.nans
+
+    def mean(self):
+        "per column mean of non-NaN values"
+        with np.errstate(invalid = "ignore", divide = "ignore"):
+            return self.sum / self.count
+
+    def var(self, ddof = 0):
+        """per column variance of non-NaN values.
+        NOTE: computed from the running sums, so it loses precision when the mean is much
+        larger than the spread; use the data itself if that matters.
+        """
+        with np.errstate(invalid = "ignore", divide = "ignore"):
+            var = (self.sumsq - self.sum*self.sum/self.count) / (self.count - ddof)
+        return np.maximum(var, 0)
+
+
+def column_stats(block):
+    "compute ColumnStats of a 2-D (Nvars, Npts) block in a single vectorized sweep per field"
+    block = np.asarray(block, dtype = np.float64)
+    nv, npts = block.shape
+    nanmask = np.isnan(block)
+    nans = nanmask.sum(axis = 1)
+    if nans.any():
+        clean = np.where(nanmask, 0.0, block)
+    else:
+        clean = block
+    if npts:
+        # fmin/fmax skip NaN, giving NaN only for all-NaN columns
+        lo = np.fmin.reduce(block, axis = 1)
+        hi = np.fmax.reduce(block, axis = 1)
+    else:
+        lo = np.full(nv, np.nan)
+        hi = np.full(nv, np.nan)
+    return ColumnStats(lo, hi, clean.sum(axis = 1), np.einsum("ij,ij->i", clean, clean),
+                       npts - nans, nans)
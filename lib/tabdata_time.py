@@ -0,0 +1,195 @@
+#
+# Time column representations for TabData
+# Copyright (C) 2018  George Shapovalov <gshapovalov@gmail.com>
+#
+# Most of our data is uniformly sampled, so the time column carries only 3 numbers worth of info.
+# UniformTime keeps just these (t0, dt, N) and computes values on demand. It quacks enough like
+# a 1-D array (indexing, slicing, len, iteration, np.asarray) to stand in for one in self.time.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import weakref
+import numpy as np
+from .tabdata_common import *
+
+
+class UniformTime:
+    """Lazy uniform time column: time[i] = t0 + (i0 + i)*dt, for i in 0..N-1.
+    i0 is an offset into the "parent" sequence, so that slices produce exactly the same values
+    as the full column would (t0 + k*dt is not the same float as (t0 + i0*dt) + (k-i0)*dt).
+    decimals, if set, rounds every value (np.round) - time read from text files is usually written
+    with a fixed number of decimals, so that t0 + i*dt itself does not reproduce it bit for bit.
+    Values are only materialized when asked for - np.asarray(time), tolist() or iteration.
+    Instances are immutable, growing is done by creating a new one (cheap). Item assignment
+    to the time of a table (table.time[i] = x) replaces it there by explicit values, see __setitem__.
+    """
+    _owner = None # weakref to the TabData this is the time of, see bound
+    def __init__(self, t0, dt, N, i0 = 0, decimals = None):
+        self.t0 = float(t0)
+        self.dt = float(dt)
+        self.N  = int(N)
+        self.i0 = int(i0)
+        self.decimals = decimals
+
+    def __repr__(self):
+        return "UniformTime(t0={}, dt={}, N={}, i0={}, decimals={})".format(
+            self.t0, self.dt, self.N, self.i0, self.decimals)
+
+    def __len__(self):
+        return self.N
+
+    @property
+    def shape(self):
+        return (self.N,)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            start, stop, step = idx.indices(self.N)
+            if step != 1:
+                return self.materialize()[idx]
+            return UniformTime(self.t0, self.dt, max(stop - start, 0), self.i0 + start, self.decimals)
+        if not isinstance(idx, (int, np.integer)):
+            # index arrays, masks and such, as numpy does them
+            return self.materialize()[idx]
+        i = int(idx)
+        if i < 0:
+            i += self.N
+        if not 0 <= i < self.N:
+            raise IndexError("time index out of range")
+        t = self.t0 + (self.i0 + i)*self.dt
+        if self.decimals is not None:
+            # same rounding as for arrays, to get identical values either way
+            t = float(np.round(np.float64(t), self.decimals))
+        return t
+
+    def __setitem__(self, idx, value):
+        """values cannot change in place: the owning table (see bound) gets explicit values
+        as its time instead, with the assignment done to them
+        """
+        owner = self._owner() if self._owner is not None else None
+        if owner is None or getattr(owner, "_time", None) is not self:
+            raise TypeError("UniformTime is immutable, use materialize() for values to edit")
+        time = self.materialize()
+        time[idx] = value
+        owner.time = time
+
+    def bound(self, owner):
+        "a copy that is the time of owner (TabData), so that item assignment gets to it"
+        time = self.copy()
+        time._owner = weakref.ref(owner)
+        return time
+
+    def __getstate__(self):
+        # the owner goes its own way when pickled
+        state = self.__dict__.copy()
+        state.pop("_owner", None)
+        return state
+
+    def materialize(self):
+        "return explicit values as a new float64 array"
+        t = self.t0 + np.arange(self.i0, self.i0 + self.N)*self.dt
+        if self.decimals is not None:
+            t = np.round(t, self.decimals)
+        return t
+
+    def __array__(self, dtype = None, copy = None):
+        arr = self.materialize()
+        return arr if dtype is None else arr.astype(dtype)
+
+    def __iter__(self):
+        return iter(self.materialize().tolist())
+
+    def tolist(self):
+        return self.materialize().tolist()
+
+    def copy(self):
+        return UniformTime(self.t0, self.dt, self.N, self.i0, self.decimals)
+
+    def resized(self, N):
+        "same time axis, extended (or cut) to N points"
+        return UniformTime(self.t0, self.dt, N, self.i0, self.decimals)
+
+
+def uniform_time(time):
+    """return UniformTime describing time if it reproduces all values bit for bit (so that nothing
+    changes in the output), otherwise time itself. Needs at least 2 points.
+    Tries plain t0 + i*dt first (as made by regenerate_time_uniform), then rounded to 0..15 decimals.
+    """
+    if isinstance(time, UniformTime) or len(time) < 2:
+        return time
+    N = len(time)
+    t0 = time[0]
+    candidates = [UniformTime(t0, time[1] - time[0], N)]
+    dt = (time[-1] - time[0])/(N - 1) # better estimate for the rounded case
+    candidates.extend(UniformTime(t0, dt, N, decimals = d) for d in range(16))
+    head = time[:64]
+    for cand in candidates:
+        # cheap check on the first few points, then the real one
+        if np.array_equal(cand[:64].materialize(), head) and np.array_equal(cand.materialize(), time):
+            return cand
+    return time
+
+
+#######################################################
+# time lookups, mix-in methods attached to TabData
+
+def _time_is_sorted(self):
+    """check (once) that an explicit time column is non-decreasing, caching the answer.
+    The cache is tied to the time object itself, so assigning a new time column resets it,
+    but in-place edits of time values are not noticed.
+    """
+    cached = getattr(self, "_time_sorted", None)
+    if cached is not None and cached[0] is self.time:
+        return cached[1]
+    flag = bool(np.all(np.diff(self.time) >= 0))
+    self._time_sorted = (self.time, flag)
+    return flag
+
+def index_of_time(self, t, side = "left"):
+    """index of the first point with time >= t (side="left") or time > t (side="right"), Npts if none.
+    Uniform time is handled with O(1) arithmetic, sorted explicit time by bisection (O(log N));
+    unsorted time falls back to a (vectorized) scan, which gives the same answer as a plain loop would.
+    """
+    if not self.has_time():
+        raise NoTime_Error("no time column")
+    if side not in ("left", "right"):
+        raise ValueError("side should be left or right")
+    time = self.time
+    N = len(time)
+    def after(v):
+        return v >= t if side == "left" else v > t
+    if isinstance(time, UniformTime) and time.dt > 0:
+        i = int(np.ceil((t - time.t0)/time.dt)) - time.i0
+        i = min(max(i, 0), N)
+        # arithmetic can be off by a point due to rounding, settle against the actual values
+        while i > 0 and after(time[i-1]):
+            i -= 1
+        while i < N and not after(time[i]):
+            i += 1
+        return i
+    time = np.asarray(time)
+    if _time_is_sorted(self):
+        return int(np.searchsorted(time, t, side))
+    mask = after(time)
+    return int(np.argmax(mask)) if mask.any() else N
+
+def time_window(self, tlo = None, thi = None):
+    """(Il, Ih) index boundaries of the time window [tlo, thi): Il is the first point at tlo or later,
+    Ih the first point at thi or later. Omitted bounds mean the beginning/end of data.
+    Use with view_rows to get the window itself.
+    """
+    Il = index_of_time(self, tlo) if tlo is not None else 0
+    Ih = index_of_time(self, thi) if thi is not None else self.Npts
+    return Il, max(Il, Ih)
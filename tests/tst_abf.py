@@ -0,0 +1,48 @@
+#! /bin/env python
+# Testing Axon binary (abf) IO with tabular data
+# Copyright (C) 2018  George Shapovalov <gshapovalov@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import sys, io
+
+from lib import tabdata
+
+test_file = "../dat/test.atf"
+
+
+with open(test_file) as F:
+    data = tabdata.from_atf(F)
+
+for dtype in ("int16", "float32"):
+    print("testing write_abf/from_abf, dtype =", dtype)
+    B = io.BytesIO()
+    data.write_abf(B, dtype = dtype)
+    B.seek(0)
+    back = tabdata.from_abf(B)
+    back.write_atf(sys.stdout, fmt = ".4e")
+    print("max deviation from the original below 1e-4:", abs(back.data - data.data).max() < 1e-4)
+    #
+    print("\ntesting column and row selection, column 1, time window 0.1..0.3")
+    tabdata.from_abf(B, usecols = [1], time_range = (0.1, 0.3)).write_atf(sys.stdout, fmt = ".4e")
+    print()
+
+print("testing gap free, 2 channels")
+data.colID = ["Time (ms)", "IN 0 (pA)", "IN 1 (mV)"]
+data.data = data.data[:2]
+B = io.BytesIO()
+data.write_abf(B, mode = "gapfree")
+B.seek(0)
+tabdata.from_abf(B).write_atf(sys.stdout, fmt = ".4e")
@@ -42,3 +42,17 @@ with open(test_file) as F:
     F.seek(0)
     data=tabdata.from_atf(F)
     data.write_atf(sys.stdout)
+    #
+    print("\ntesting iter_chunks, 4 rows per chunk")
+    F.seek(0)
+    for chunk in tabdata.iter_chunks(F, "atf", rows=4):
+        print("chunk of ", chunk.Npts, " rows, starting at t=", chunk.time[0])
+
+print("\ntesting column stats after in-place edits")
+with open(test_file) as F:
+    data = tabdata.from_atf(F)
+print("max_data:", data.max_data(), " max_in_col(0):", data.max_in_col(0))
+data.data[0][0] = 1e9
+print("max_data:", data.max_data(), " max_in_col(0):", data.max_in_col(0))
+data.data[0] -= 1e9
+print("min_data:", data.min_data(), " min_in_col(0):", data.min_in_col(0))
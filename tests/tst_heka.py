@@ -34,3 +34,14 @@ print("\ntesting read constructor; replacing Separator (, -> ;)")
 with open(fn) as F:
     data = tabdata.from_HEKA_csv(F)
     data.write_atf(sys.stdout)
+
+print("\ntesting 2 channel file, Vmon only, time window 0.1..0.3")
+with open("../dat/test_heka_2ch.csv") as F:
+    data = tabdata.from_HEKA_csv(F, channels = ["Vmon"], time_range = (0.1, 0.3))
+    data.write_atf(sys.stdout)
+
+print("\ntesting iter_HEKA_csv, sweep by sweep")
+with open("../dat/test_heka_2ch.csv") as F:
+    for sweep in tabdata.TabData().iter_HEKA_csv(F):
+        print(sweep.comments[0], sweep.colID, "Imon range:", sweep.data[0].min(), sweep.data[0].max(),
+              "Vmon mean:", sweep.data[1].mean())
@@ -0,0 +1,73 @@
+#! /bin/env python
+# Testing direct reads of HEKA PatchMaster bundles
+# Copyright (C) 2018  George Shapovalov <gshapovalov@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import sys, io, struct
+
+from lib import tabdata
+
+# no PatchMaster files come with the package, so a small bundle is made up here:
+# group 1 is empty, series 2.1 has 3 sweeps of 2 traces: Imon (int16, A) and Vmon (float32, V)
+sizes = [640, 144, 1408, 288, 512] # record sizes of root, group, series, sweep, trace
+
+def record(level, label, **fields):
+    buf = bytearray(sizes[level])
+    struct.pack_into("<32s", buf, 4, label.encode())
+    for offset, fmt, val in fields.values():
+        struct.pack_into("<" + fmt, buf, offset, val)
+    return bytes(buf)
+
+Npts, data, traces = 8, b"", []
+for sweep in range(3):
+    imon = [100*sweep + k for k in range(Npts)]
+    vmon = [-0.07 + 0.01*sweep]*Npts
+    for label, fmt, code, unit, values, scaler in (("Imon", "h", 0, b"A", imon, 1e-12), ("Vmon", "f", 2, b"V", vmon, 1.0)):
+        traces.append(record(4, label, data = (40, "i", 256 + len(data)), points = (44, "i", Npts),
+                             format = (70, "b", code), scaler = (72, "d", scaler), yunit = (96, "8s", unit),
+                             dx = (104, "d", 2e-5), x0 = (112, "d", 0.0), xunit = (120, "8s", b"s")))
+        data += struct.pack("<{}{}".format(Npts, fmt), *values)
+
+def children(N):
+    return struct.pack("<i", N)
+
+pul = b"eerT" + struct.pack("<i5i", 5, *sizes)
+pul += record(0, "") + children(2) + record(1, "E-1") + children(0) + record(1, "E-2") + children(1)
+pul += record(2, "IV") + children(3)
+for sweep in range(3):
+    pul += record(3, "Sweep{}".format(sweep + 1)) + children(2)
+    pul += traces[2*sweep] + children(0) + traces[2*sweep + 1] + children(0)
+
+header = bytearray(256)
+struct.pack_into("<8s32sdi?", header, 0, b"DAT2", b"v2x90.5", 0.0, 2, True)
+struct.pack_into("<ii8s", header, 64, 256, len(data), b".dat")
+struct.pack_into("<ii8s", header, 80, 256 + len(data), len(pul), b".pul")
+bundle = io.BytesIO(bytes(header) + data + pul)
+
+
+print("testing list_HEKA_dat")
+for entry in tabdata.list_HEKA_dat(bundle):
+    print(entry)
+
+print("\ntesting from_HEKA_dat, series 2.1, all sweeps and traces")
+tabdata.from_HEKA_dat(bundle, series = "2.1").write_atf(sys.stdout)
+
+print("\ntesting trace selection by label, sweeps 1 and 3, time window 0.04..0.12")
+tabdata.from_HEKA_dat(bundle, series = (2, 1), sweeps = [1, 3], traces = ["Imon"],
+                      time_range = (0.04, 0.12)).write_atf(sys.stdout)
+
+print("\ntesting from_format")
+tabdata.from_format(bundle, "heka_dat", series = "2.1", traces = [2], row_range = (0, 2)).write_atf(sys.stdout)
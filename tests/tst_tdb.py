@@ -0,0 +1,73 @@
+#! /bin/env python
+# Testing binary (tdb) IO with tabular data
+# Copyright (C) 2018  George Shapovalov <gshapovalov@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import sys, io
+
+from lib import tabdata
+
+test_file = "../dat/test.atf"
+
+
+with open(test_file) as F:
+    data = tabdata.from_atf(F)
+
+for compress in (None, "zlib"):
+    print("testing write_tdb/from_tdb, compress =", compress)
+    B = io.BytesIO()
+    data.write_tdb(B, compress = compress, chunk_rows = 4)
+    B.seek(0)
+    tabdata.from_tdb(B).write_atf(sys.stdout)
+    #
+    print("\ntesting column and row selection, column 1, rows 2..7")
+    tabdata.from_tdb(B, usecols = [1], row_range = (2, 7)).write_atf(sys.stdout)
+    #
+    print("\ntesting time window 0.1..0.3")
+    tabdata.from_tdb(B, time_range = (0.1, 0.3)).write_atf(sys.stdout)
+    #
+    print("\ntesting iter_chunks, 3 rows per chunk")
+    for chunk in tabdata.iter_chunks(B, "tdb", rows = 3):
+        print("chunk of ", chunk.Npts, " rows, starting at t=", chunk.time[0])
+    print()
+
+print("testing convert atf -> tdb -> atf")
+B = io.BytesIO()
+with open(test_file) as F:
+    tabdata.convert(F, "atf", B, "tdb", rows = 3)
+B.seek(0)
+tabdata.convert(B, "tdb", sys.stdout, "atf")
+
+print("\ntesting tdb without a time column")
+with open("../dat/test.csv") as F:
+    data = tabdata.from_csv(F, no_time = True)
+B = io.BytesIO()
+data.write_tdb(B)
+B.seek(0)
+data = tabdata.from_tdb(B)
+print("has time:", data.has_time())
+data.write_csv(sys.stdout)
+
+print("\ntesting cache hit of a table without a time column")
+import os, shutil, tempfile
+cache = tempfile.mkdtemp()
+os.environ[tabdata.Cache_Dir_Env] = cache
+for i in range(2):
+    with open("../dat/test.csv") as F:
+        data = tabdata.from_format(F, "csv", cache = True, no_time = True)
+    print("read", i, "is_view:", data.is_view(), "has time:", data.has_time(), "Npts:", data.Npts)
+data.write_csv(sys.stdout)
+shutil.rmtree(cache)
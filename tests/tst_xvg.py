@@ -34,3 +34,18 @@ print("\ntesting read constructor, print as atf")
 with open(fn) as F:
     data = tabdata.from_xvg(F)
     data.write_atf(sys.stdout)
+
+print("\ntesting multi-set file, sets one by one")
+with open("../dat/sample_general.xvg") as F:
+    for s in tabdata.TabData().iter_xvg_sets(F):
+        print(s.headers[-2:], s.colID, s.Npts)
+
+print("\nselected sets only, first rows, print as csv")
+with open("../dat/sample_general.xvg") as F:
+    for s in tabdata.TabData().iter_xvg_sets(F, sets = [1, "*b = 100"], row_range = (0, 3)):
+        s.write_csv(sys.stdout)
+
+print("\nsets side by side, print as csv")
+with open("../dat/sample_general.xvg") as F:
+    data = tabdata.from_xvg(F, sets = [0, 2], time_range = (None, 0.03))
+    data.write_csv(sys.stdout)
@@ -34,7 +34,8 @@ Y clumns are collated.
     parser.add_argument('fn', nargs="+", help="list of file names to collate")
     parser.add_argument('-t0', type=float, help="initial time (use t0 i 1st file if omitted)")
     parser.add_argument('-dt', type=float, help="time step (use dt in 1st file if omitted)")
-    parser.add_argument('-o',  help="name of output file. If omitted, uses fn1[:-3]_combined.atf")
+    parser.add_argument('-o',  help="name of output file. If omitted, uses fn1[:-3]_combined.atf. Name ending with .abf gives an Axon binary file")
+    parser.add_argument('-j', type=int, default=1, help="parse files in this many parallel processes, 0 - one per CPU; default 1")
     return parser.parse_args()
 
 
@@ -43,26 +44,24 @@ Y clumns are collated.
 #main block
 args = ProcessCommandLine()
 
-# read the 1st file and init the time column params
-with open(args.fn[0]) as F:
-    data = tabdata.from_atf(F, strict_rect = True)
+# parse all files (in parallel with -j), then init the time column params from the 1st one
+tables = tabdata.load_many(args.fn, "atf", workers = args.j or None, strict_rect = True)
+data = tables[0]
 
 t0 = args.t0 if args.t0 else data.time[0]
 dt = args.dt if args.dt else data.time[1] - data.time[0]
 
 # now process the rest
-for fn in args.fn[1:]:
-    with open(fn) as F:
-        newdat = tabdata.from_atf(F)
-        if (newdat.Nvars != data.Nvars):
-            print("file ", fn, " has mismatching number of columns!")
-            sys.exit()
-        # now append column
-        data.append_rows(newdat)
+for fn, newdat in zip(args.fn[1:], tables[1:]):
+    if (newdat.Nvars != data.Nvars):
+        print("file ", fn, " has mismatching number of columns!")
+        sys.exit()
+    # now append column
+    data.append_rows(newdat)
 
 # regenerate time column with given params
 data.regenerate_time_uniform(t0=t0,dt=dt)
 
 fn = args.o if args.o else args.fn[0][:-4]+"_combined.atf"
 with open(fn, mode='w') as F:
-    data.write_atf(F)
+    data.to_format(F, "abf" if fn.endswith(".abf") else "atf")
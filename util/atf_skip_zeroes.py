@@ -52,8 +52,10 @@ N0 = args.s0 if args.s0 else 3
 
 # read the 1st file and init the time column params
 with open(args.fn) as F:
-    data = tabdata.from_atf(F, strict_rect = True)
+    # lazy: only the scanned column gets decoded, unless there is something to cut out
+    data = tabdata.from_atf(F, strict_rect = True, lazy = True)
     print("read data from ", args.fn)
+col = data.column(Ncol)
 
 LastIdx = data.Npts - N0 # last index to check..
 
@@ -64,11 +66,11 @@ def find_zero_block(data, start):
     while curpos < LastIdx:
         incomplete = False
         for i in range(curpos, LastIdx):
-            if data.data[Ncol][i] == 0:
+            if col[i] == 0:
                 # found 1st zero, scan to check if its a block or an occasional 0..
                 #print("found 0 at ", i)
                 for j in range(i+1, i+N0):
-                    if data.data[Ncol][j] != 0:
+                    if col[j] != 0:
                         curpos = j
                         incomplete = True
                         break
@@ -102,7 +104,7 @@ else:
 while Nend < data.Npts:
     # first find the beginning of the next non-zero block..
     for i in range(Nend+N0, data.Npts):
-        if data.data[Ncol][i] != 0:
+        if col[i] != 0:
             Nbeg = i
             break
     if Nbeg < Nend:
@@ -37,6 +37,7 @@ There should be a single time column in each file, which (ideally) should match
     parser.add_argument('-o', help="name of output file. If omitted, output goes to stdout")
     parser.add_argument('-p', default=',',  help="output separator, default is ',' (comma)")
     parser.add_argument('-s', default='\t', help= "input separator, default is TAB")
+    parser.add_argument('-j', type=int, default=1, help="parse files in this many parallel processes, 0 - one per CPU; default 1")
     return parser.parse_args()
 
 
@@ -48,19 +49,17 @@ args = ProcessCommandLine()
 # print(args.s)
 # sys.exit()
 
-#get the 1st file in to serve as a base to collate upon
-with open(args.fn[0]) as F:
-    data = tabdata.from_csv(F, Separator = args.s)
+# parse all files (in parallel with -j), the 1st one serves as a base to collate upon
+tables = tabdata.load_many(args.fn, "csv", workers = args.j or None, Separator = args.s)
+data = tables[0]
 
 # now process the rest
-for fn in args.fn[1:]:
-    with open(fn) as F:
-        newdat = tabdata.from_csv(F, Separator = args.s)
-        if (newdat.Npts != data.Npts):
-            print("lengths of supplied files do not match!")
-            sys.exit()
-        # now append column
-        data.append_columns(newdat)
+for newdat in tables[1:]:
+    if (newdat.Npts != data.Npts):
+        print("lengths of supplied files do not match!")
+        sys.exit()
+    # now append column
+    data.append_columns(newdat)
 
 
 if args.o:
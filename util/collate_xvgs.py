@@ -36,6 +36,7 @@ a single X column in each file, which (ideally) should match throughout.
     #parser.add_argument('-g', default='grid_table.lst', help="name of the file with the grid of the aspect factors, defaults to 'grid_table.lst'")
     #parser.add_argument('-p', action='store_true', help="print the table with weights as well")
     parser.add_argument('-o', help="name of output file. If omitted, uses fn1[:-3].atf")
+    parser.add_argument('-j', type=int, default=1, help="parse files in this many parallel processes, 0 - one per CPU; default 1")
     #parser.add_argument('-s', help="skip S header lines")
     return parser.parse_args()
 
@@ -45,21 +46,17 @@ a single X column in each file, which (ideally) should match throughout.
 #main block
 args = ProcessCommandLine()
 
-#get the 1st file in to serve as a base to collate upon
-with open(args.fn[0]) as F:
-    data = tabdata.TabData()
-    tabdata_io.read_xvg_byGmx(data, F)
+# parse all files (in parallel with -j), the 1st one serves as a base to collate upon
+tables = tabdata.load_many(args.fn, "xvg", workers = args.j or None)
+data = tables[0]
 
 # now process the rest
-for fn in args.fn[1:]:
-    with open(fn) as F:
-        newdat = tabdata.TabData()
-        tabdata_io.read_xvg_byGmx(newdat, F)
-        if (newdat.Npts != data.Npts):
-            print("lengths of supplied files do not match!")
-            sys.exit()
-        # now append column
-        data.append_columns(newdat, ncols=1)
+for newdat in tables[1:]:
+    if (newdat.Npts != data.Npts):
+        print("lengths of supplied files do not match!")
+        sys.exit()
+    # now append column
+    data.append_columns(newdat, ncols=1)
 
 
 if args.o:
@@ -67,5 +64,5 @@ if args.o:
 else:
 	F = open(args.fn[0][:-4]+"_new.xvg", mode='w')
 
-tabdata_io.write_xvg_byGmx(data, F)
+data.write_xvg(F)
 F.close()
@@ -32,12 +32,7 @@ def ProcessCommandLine():
 
 args=ProcessCommandLine()
 
-data = tabdata.TabData()
-with open(args.fn) as F:
-    #print("reading cvs")
-    data.read_csv(F)
-
-# all data read, now lets figure out out file name
+# figure out output file name and stream the data through
 fn = args.o if args.o else args.fn[:-3]+"atf"
-with open(fn, mode='w') as F:
-    data.write_atf(F)
+with open(args.fn) as F, open(fn, mode='w') as Fout:
+    tabdata.convert(F, "csv", Fout, "atf")
@@ -1,5 +1,5 @@
 #! /bin/env python
-# Basic conversion of HEKA text files to ATF
+# Basic conversion of HEKA text files (or PatchMaster .dat bundles) to ATF
 # Copyright (C) 2018  George Shapovalov <gshapovalov@gmail.com>
 #
 # This program is free software: you can redistribute it and/or modify
@@ -22,20 +22,33 @@ import sys, argparse
 from lib import tabdata
 
 def ProcessCommandLine():
-    parser = argparse.ArgumentParser(description="convert HEKA text output to atf format")
+    parser = argparse.ArgumentParser(description="convert HEKA text output (or a series of a PatchMaster .dat bundle) to atf format")
     parser.add_argument('fn',   help="input file name")
-    parser.add_argument('-o',  help="name of output file. If omitted replace last 3 chars with atf")
+    parser.add_argument('-s',  default="1.1", help="series to convert from a PatchMaster bundle, as group.series; default 1.1")
+    parser.add_argument('-l',  action="store_true", help="list the series in a PatchMaster bundle and exit")
+    parser.add_argument('-o',  help="name of output file. If omitted replace last 3 chars with atf. Name ending with .abf gives an Axon binary file")
     #parser.add_argument('-nt',  action="store_true", help="no time column")
     return parser.parse_args()
 
 args=ProcessCommandLine()
 
-data = tabdata.TabData()
-with open(args.fn) as F:
-    #print("reading cvs")
-    data.read_HEKA_csv(F)
+# figure output file name and pass the data through
+with open(args.fn, mode='rb') as F:
+    bundle = F.read(4) in (b"DAT1", b"DAT2", b"DATA")
+if args.l:
+    if not bundle:
+        print(args.fn, "is not a PatchMaster bundle")
+        sys.exit()
+    with open(args.fn, mode='rb') as F:
+        for path, label, Nsweeps, traces in tabdata.list_HEKA_dat(F):
+            print(path, label, Nsweeps, "sweeps, traces:", " ".join(traces))
+    sys.exit()
 
-# all data read, now lets figure output file name
 fn = args.o if args.o else args.fn[:-3]+"atf"
-with open(fn, mode='w') as F:
-    data.write_atf(F)
+oFmt = "abf" if fn.endswith(".abf") else "atf"
+if bundle:
+    with open(args.fn, mode='rb') as F, open(fn, mode='w') as Fout:
+        tabdata.from_HEKA_dat(F, series = args.s).to_format(Fout, oFmt)
+else:
+    with open(args.fn) as F, open(fn, mode='w') as Fout:
+        tabdata.convert(F, "heka_csv", Fout, oFmt)
@@ -52,13 +52,8 @@ Missing boundary index means beginning or end of data.
 ### helpers ###
 def calcAvg(data, Il, Ih):
     "calc average per column in a given boundary"
-    S=[]
-    for i in range(len(data.data)):
-        S.append(0)
-        for j in range(Il, Ih):
-            S[i] += data.data[i][j]
-        S[i] /= (Ih-Il)
-    return S
+    # baseline window is a view, no copying
+    return data.view_rows(Il, Ih).data.mean(axis=1)
 
 
 ##########################################
@@ -96,11 +91,8 @@ if (args.tl or args.th) and not hasattr(data,"time"):
 if args.il:
     Il = int(args.il)
 elif args.tl:
-    # iterate over time - less efficient, but we have no to,dt setup and this handles nonuniform time too..
-    for i in range(len(data.time)):
-        if data.time[i] >= args.tl:
-            Il = i
-            break
+    # first point at or past tl; O(1) for uniform time, bisection otherwise
+    Il = data.index_of_time(args.tl)
 else:
     Il = 0
 
@@ -108,10 +100,7 @@ else:
 if args.ih:
     Ih = int(args.ih)
 elif args.th:
-    for i in range(Il,len(data.time)):
-        if data.time[i] >= args.th:
-            Ih = i
-            break
+    Ih = max(Il, data.index_of_time(args.th))
 else:
     Ih = len(data.time)
 # done with baseline indices
@@ -124,15 +113,11 @@ avg = calcAvg(data,Il,Ih)
 
 # do an in-place normalization
 ## NOTE: should be moved to tabdata.method, ideally in the subpackage
-for i in range(len(data.data)):
-    for j in range(len(data.data[0])):
-        data.data[i][j] = data.data[i][j] / avg[i]
+data.data /= avg[:, None]
 
 if args.s:
     # also do the subtraction
-    for i in range(len(data.data)):
-        for j in range(len(data.data[0])):
-            data.data[i][j] -= 1
+    data.data -= 1
 
 # finally otput
 if args.o:
@@ -73,6 +73,7 @@ def ProcessCommandLine():
     parser.add_argument('-s', default=FNStub, help="file name pattern to append (in case multiple reruns with different subsets over the same files are needed)")
     #parser.add_argument('-grc', action='count', help="create the grace_str and grace_trj list files and the")
     parser.add_argument('-gas', action='store_true', help="autoscale y value for grace batch files (ignore value set in the script)")
+    parser.add_argument('-j', type=int, default=1, help="parse files in this many parallel processes, 0 - one per CPU; default 1")
     parser.add_argument('-v',   action='count', help="be verbose")
     return parser.parse_args()
 
@@ -131,32 +132,28 @@ def combine_files(inOrder, GG):
             combo = Tokens[0]+"_"+tok
             title = Tokens[0]
         #
-        with open(args.fb+combo+".xvg") as F:
-            data = tabdata.TabData()
-            tabdata_io.read_xvg_gmx(data, F)
-            # disable subtitle and replace title with something meaningful
-            for i in range(len(data.headers)):
-                if data.headers[i].find("   title") != -1:
-                    data.headers[i] = '    title "{}"'.format(title)
-                if data.headers[i].find("subtitle") != -1:
-                    data.headers[i] = ' subtitle ""'
-            # set the color of the 1st dataset
-            data.headers.append("s0 line color {}".format(ColorDict[Tokens[0]]))
+        data = tabdata.load(args.fb+combo+".xvg", "xvg")
+        # disable subtitle and replace title with something meaningful
+        for i in range(len(data.headers)):
+            if data.headers[i].find("   title") != -1:
+                data.headers[i] = '    title "{}"'.format(title)
+            if data.headers[i].find("subtitle") != -1:
+                data.headers[i] = ' subtitle ""'
+        # set the color of the 1st dataset
+        data.headers.append("s0 line color {}".format(ColorDict[Tokens[0]]))
         # now process the rest
         for i in range(1,len(Tokens)):
             if inOrder: combo = tok+"_"+Tokens[i]
             else: combo = Tokens[i]+"_"+tok
-            with open(args.fb+combo+".xvg") as F:
-                newdat = tabdata.TabData()
-                tabdata_io.read_xvg_gmx(newdat, F)
-                #if (newdat.Npts != data.Npts):
-                    #print("lengths of supplied files do not match!")
-                    #sys.exit()
-                # now append column
-                data.append_columns(newdat, ncols=1, shorten=True)
-                data.headers.append("s{} line color {}".format(i, ColorDict[Tokens[i]]))
-                #data.headers.append("s{} hidden false".format(i))
-                #data.headers.append("s{} type xy".format(i))
+            newdat = tabdata.load(args.fb+combo+".xvg", "xvg", usecols = 0) # only the 1st column is used
+            #if (newdat.Npts != data.Npts):
+                #print("lengths of supplied files do not match!")
+                #sys.exit()
+            # now append column
+            data.append_columns(newdat, ncols=1, shorten=True)
+            data.headers.append("s{} line color {}".format(i, ColorDict[Tokens[i]]))
+            #data.headers.append("s{} hidden false".format(i))
+            #data.headers.append("s{} type xy".format(i))
         # now we are ready to output
         with open(outName(tok,byStr), mode='w') as F:
             tabdata_io.write_xvg_gmx(data, F)
@@ -176,6 +173,9 @@ if args.v:
     print("list of file tokens: ", Tokens)
     print("dict of colors:", ColorDict)
 
+# parse all the files up front (in parallel with -j), loads below are then served from memory
+tabdata.load_many([args.fb+a+"_"+b+".xvg" for a in Tokens for b in Tokens], "xvg", workers = args.j or None, memo = True)
+
 def outName(tok, byStr = "by_str-"):
     return args.fb + args.s + byStr + tok + ".xvg"
 
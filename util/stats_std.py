@@ -20,6 +20,7 @@ This calculates basic stats on the passed data file: average, std dev, s.e.m..
 #
 
 import sys, argparse, math
+import numpy as np
 from lib import tabdata, tabdata_io
 
 File_Formats = ['csv', 'atf', 'xvg']
@@ -73,55 +74,36 @@ else:
         sys.exit()
     fFmt = FExt
 
-#get the 1st file in to serve as a base to collate upon
-with open(args.fn) as F:
-    data = tabdata.from_format(F,fFmt)
-
 # setup boundaries
 # most (all?) of the data are going to have a time column (as otherwise x bounds make not much sense).
 # So, enforce time column presence if boundaries are pased
-if (args.bl or args.bh) and not hasattr(data,"time"):
+bounded = args.bl is not None or args.bh is not None
+
+#get the 1st file in to serve as a base to collate upon
+# only the rows between the boundaries are parsed, reading stops past the high one.
+# If the file was indexed (tabindex.py), reading starts right at the low one
+try:
+    data = tabdata.from_indexed(args.fn, fFmt, time_range = (args.bl, args.bh) if bounded else None)
+except tabdata.NoTime_Error:
+    data = None
+if bounded and (data is None or not hasattr(data,"time")):
     print("boundaries are passed, data has to have a time column!\nAborting..")
     sys.exit()
 
-if args.bl:
-    # iterate over time - less efficient, but we have no to,dt setup and this handles nonuniform time too..
-    for i in range(len(data.time)):
-        if data.time[i] >= args.bl:
-            Il = i
-            break
-else:
-    Il = 0
-    
-if args.bh:
-    for i in range(Il,len(data.time)):
-        if data.time[i] >= args.bh:
-            Ih = i
-            break
-else:
-    Ih = len(data.time)
+# all rows read are within the boundaries
+Il, Ih = 0, data.Npts
 
 #
 # now the calcs
 def calcAvg(data, Il, Ih):
     "calc average per column in a given boundary"
-    S=[]
-    for i in range(len(data.data)):
-        S.append(0)
-        for j in range(Il, Ih):
-            S[i] += data.data[i][j]
-        S[i] /= (Ih-Il)
-    return S
+    # boundary window is a view, no copying
+    return data.view_rows(Il, Ih).data.mean(axis=1).tolist()
 
 def calcSD(data, Il, Ih, avg):
     "standard deviation calc. Il,Ih - boundary indices. Avg - vector of averages (which is goonna be computed already)"
-    S=[]
-    for i in range(len(data.data)):
-        S.append(0)
-        for j in range(Il, Ih):
-            S[i] += (data.data[i][j] - avg[i])**2
-        S[i] = math.sqrt(S[i]/(Ih-Il-1))
-    return S
+    win = data.view_rows(Il, Ih).data
+    return np.sqrt(((win - np.array(avg)[:, None])**2).sum(axis=1)/(Ih-Il-1)).tolist()
 
 def calcSEMfromSD(Il, Ih, SD):
     "just does rescaling (div by sqrt(N))"
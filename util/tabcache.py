@@ -0,0 +1,61 @@
+#! /usr/bin/python
+'''Inspect and clean up the persistent cache of parsed data files'''
+
+# Copyright (C) 2018  George Shapovalov <gshapovalov@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os, time, argparse
+from lib.tabdata_common import *
+from lib import tabdata
+
+
+def ProcessCommandLine():
+    parser = argparse.ArgumentParser(description='''Inspect and clean up the parsed data cache.
+
+Lists cached files (most recently used first) if no action is given.
+The cache lives in ${} (default ~/.cache/tabdata) and is filled by from_format(..., cache=True).
+'''.format(Cache_Dir_Env))
+    parser.add_argument('-c', action='store_true', help="clear: drop all entries")
+    parser.add_argument('-m', type=float, help="prune least recently used entries down to this many MB")
+    parser.add_argument('-s', action='store_true', help="drop stale entries, whose source file is gone or changed")
+    return parser.parse_args()
+
+def MB(nbytes):
+    return "{:.1f}MB".format(nbytes/(1 << 20))
+
+
+##########################################
+### main ###
+args = ProcessCommandLine()
+
+if args.c:
+    print("dropped", tabdata.cache_clear(), "entries")
+if args.s:
+    dropped = 0
+    for e in tabdata.cache_entries():
+        path = e["path"]
+        if not path or not os.path.isfile(path) or tabdata.cache_key(path, e["fmt"]) != e["key"]:
+            tabdata.cache_remove(e["key"])
+            dropped += 1
+    print("dropped", dropped, "stale entries")
+if args.m is not None:
+    print("dropped", tabdata.cache_prune(int(args.m*(1 << 20))), "entries")
+if not (args.c or args.s or args.m is not None):
+    entries = tabdata.cache_entries()
+    for e in entries:
+        print("{}  {:>9}  {:8}  {}".format(time.strftime("%Y-%m-%d %H:%M", time.localtime(e["used"])),
+                                           MB(e["bytes"]), e["fmt"], e["path"]))
+    print(tabdata.cache_dir(), ": ", len(entries), " entries, ", MB(sum(e["bytes"] for e in entries)), sep='')
@@ -0,0 +1,58 @@
+#! /usr/bin/python
+'''Convert between any of the supported tabular formats, streaming'''
+
+# Copyright (C) 2018  George Shapovalov <gshapovalov@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import sys, argparse
+from lib.tabdata_common import *
+from lib import tabdata
+
+
+def ProcessCommandLine():
+    parser = argparse.ArgumentParser(description='''Convert a data file between supported formats.
+
+The file is piped through in chunks of rows, so memory use stays bounded and output starts
+immediately (except for heka_csv input, which has to be read whole as sweeps are stored one after another).
+Formats are determined from file extensions or given by options.
+Use '-' as input file name for stdin, omit -o for stdout.
+''')
+    parser.add_argument('fn', help="input file name; use '-' for standard input")
+    parser.add_argument('-f', choices=TabData_Formats, help="input data format")
+    parser.add_argument('-t', choices=list(tabdata.TabData.writers), help="output data format")
+    parser.add_argument('-o', help="name of output file. If omitted, output goes to stdout")
+    parser.add_argument('-r', type=int, default=Bulk_Block_Rows, help="rows per chunk, default is {}".format(Bulk_Block_Rows))
+    parser.add_argument('-j', type=int, default=1, help="parse input in this many processes (0 - all CPUs), default is 1. Needs a regular input file of csv, atf or xvg format")
+    return parser.parse_args()
+
+
+##########################################
+### main ###
+args = ProcessCommandLine()
+
+fFmt = args.f if args.f else format_by_ext(args.fn)
+oFmt = args.t if args.t else (format_by_ext(args.o) if args.o else None)
+if fFmt is None or oFmt is None:
+    print("cannot determine input or output format, pass -f/-t")
+    sys.exit()
+
+Fin  = sys.stdin if args.fn == '-' else open(args.fn)
+Fout = open(args.o, mode='w') if args.o else sys.stdout
+
+tabdata.convert(Fin, fFmt, Fout, oFmt, rows = args.r, workers = args.j or None)
+
+if args.fn != '-': Fin.close()
+if args.o: Fout.close()
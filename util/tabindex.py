@@ -0,0 +1,54 @@
+#! /usr/bin/python
+'''Build sidecar row indices for fast windowed reads of large text data files'''
+
+# Copyright (C) 2018  George Shapovalov <gshapovalov@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import sys, argparse
+from lib.tabdata_common import *
+from lib import tabdata
+
+
+def ProcessCommandLine():
+    parser = argparse.ArgumentParser(description='''Build sidecar row indices (<file>.{}).
+
+Each file is scanned once, recording byte offsets and times of every K-th data row.
+Windowed reads (tabdata.from_indexed, stats_std.py) then seek straight to the requested rows.
+An index goes stale (and is ignored) once its data file changes, just rerun this then.
+Formats are determined from file extensions or given by an option.
+'''.format(Index_Extension))
+    parser.add_argument('fn', nargs='+', help="data files to index")
+    parser.add_argument('-f', choices=list(tabdata.Indexed_Formats), help="data format of the files")
+    parser.add_argument('-k', type=int, default=Index_Every_Rows, help="rows between checkpoints, default is {}".format(Index_Every_Rows))
+    parser.add_argument('-u', action='store_true', help="update: only (re)index files without an up to date index")
+    parser.add_argument('-v', action='store_true', help="be verbose")
+    return parser.parse_args()
+
+
+##########################################
+### main ###
+args = ProcessCommandLine()
+
+for fn in args.fn:
+    fFmt = args.f if args.f else format_by_ext(fn)
+    if fFmt not in tabdata.Indexed_Formats:
+        print("cannot index", fn, "pass -f with one of", list(tabdata.Indexed_Formats))
+        continue
+    if args.u and tabdata.load_index(fn, fFmt) is not None:
+        if args.v: print(fn, "index is up to date")
+        continue
+    index = tabdata.build_index(fn, fFmt, every = args.k)
+    if args.v: print(fn, ": ", index.Nrows, " rows, ", len(index), " checkpoints", sep='')
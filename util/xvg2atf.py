@@ -18,7 +18,7 @@
 #
 
 import sys,argparse
-from tabular_data import *
+from lib import tabdata
 
 
 # ------------------------------------------------
@@ -49,14 +49,11 @@ if args.fn == '-':
 else:
     F = open(args.fn)
 
-data = Tabular_Data()
-data.read_xvg(F)
-F.close()
-
 if args.o:
-	F = open(args.o, mode='w')
+	Fout = open(args.o, mode='w')
 else:
-	F = open(args.fn[:-3]+"atf", mode='w')
+	Fout = open(args.fn[:-3]+"atf", mode='w')
 
-data.write_atf(F)
+tabdata.convert(F, "xvg", Fout, "atf")
 F.close()
+Fout.close()